@@ -1,11 +1,15 @@
+import hashlib
 import logging
 import asyncio
 import traceback
-import re
+from itertools import count
+from collections import Counter, defaultdict, deque
 from concurrent.futures import CancelledError
+from ttldict import TTLOrderedDict
 from discord.ext import commands
 from utils import permission_node
-from .utils import RelayConfig
+from .utils import RelayConfig, Dispatcher, Packet, Spill, FRAMED, maxframe, \
+    policies, overflow, convert_to, escape, clean, clean_emoji
 
 log = logging.getLogger('charfred')
 
@@ -28,84 +32,25 @@ defaulttypes = {
 }
 
 
-minecraftpat = re.compile('(&[lmnok])(.*?)(&r|$)')
-
-unconvertablepat = re.compile('(&[0-9a-fr])')
-
-discordpat = re.compile('(\\*\\*|\\*|~~|__|_)(.*?)(\\1)')
-
-emojipat = re.compile('(<.?:)(.*?)(:\d*?>)')
-
-
-def _scramble(scramblee):
-    return u'█' * len(scramblee)
-
-
-minecraftreplacements = {
-    '&l': '**',
-    '&m': '~~',
-    '&n': '__',
-    '&o': '*'
-}
-
-discordreplacements = {
-    '**': '&l',
-    '*': '&o',
-    '_': '&o',
-    '__': '&n',
-    '~~': '&m'
-}
-
-
-def _mine_replacer(match):
-    if match.group(1) == '&k':
-        return _scramble(match.group(2)) + ' '
-    else:
-        try:
-            r = minecraftreplacements[match.group(1)]
-        except KeyError:
-            r = ''
-
-        return f'{r}{minecraftpat.sub(_mine_replacer, match.group(2)).strip()}{r} '
-
-
-def _disco_replacer(match):
-    try:
-        r = discordreplacements[match.group(1)]
-    except KeyError:
-        r = ''
-
-    return f'{r}{discordpat.sub(_disco_replacer, match.group(2)).strip()}&r'
-
-
-def convert_to(content, to_discord=True):
-    if to_discord:
-        return unconvertablepat.sub('', minecraftpat.sub(_mine_replacer, content))
-    else:
-        return discordpat.sub(_disco_replacer, content)
-
-
-def escape(string):
-    return string.strip().replace('\n', '\\n').replace('::', ':\:').replace('::', ':\:')
-
-
-def clean_emoji(string):
-    return emojipat.sub(':\g<2>:', string)
-
-
-def clean(string):
-    return convert_to(escape(clean_emoji(string)), to_discord=False)
-
-
 class ChatRelay(commands.Cog):
+    maxbatch = 256
+
     def __init__(self, bot):
         self.bot = bot
         self.loop = bot.loop
-        self.inqueue = asyncio.Queue(maxsize=64, loop=self.loop)
-        self.clients = {}
-        self.inqueue_worker_task = None
         self.cfg = RelayConfig(f'{bot.dir}/configs/chatrelaycfg.toml',
                                initial=defaulttypes, load=True, loop=self.loop)
+        self.spillpath = f'{bot.dir}/data/chatrelay'
+        self.inqueue = asyncio.Queue(maxsize=self.cfg.overflow['inqueuesize'], loop=self.loop)
+        self.instats = Counter()
+        self.inspill = Spill(self.loop, f'{self.spillpath}/incoming.spill', stats=self.instats)
+        self.clients = {}
+        self.clientstats = defaultdict(Counter)
+        self.inqueue_worker_task = None
+        self.stats = Counter()
+        self.seq = count()
+        self.prefixes = TTLOrderedDict(default_ttl=300)
+        self.dispatcher = Dispatcher(self.loop, stats=self.stats)
         self.server = bot.get_cog('StreamServer')
         if self.server:
             self.server.register_handshake('ChatRelay', self.connection_handler)
@@ -115,6 +60,7 @@ class ChatRelay(commands.Cog):
             self.server.unregister_handshake('ChatRelay')
         if self.inqueue_worker_task:
             self.inqueue_worker_task.cancel()
+        self.dispatcher.cancel()
         if self.clients:
             for client in self.clients.values():
                 try:
@@ -137,30 +83,19 @@ class ChatRelay(commands.Cog):
 
             # Check whether the message is a command, as determined
             # by having a valid prefix, and don't proceed if it is.
-            prefix = await self.bot.get_prefix(message)
-            if isinstance(prefix, str):
-                if message.content.startswith(prefix):
-                    return
-            else:
-                try:
-                    if message.content.startswith(tuple(prefix)):
-                        return
-                except TypeError:
-                    # If we get here, then the prefixes are borked.
-                    raise
+            if message.content.startswith(await self.getprefixes(message)):
+                return
 
             try:
                 routedtype = self.cfg.ch_type[ch_id][0]
             except KeyError:
                 out = f'MSG::Discord::{escape(message.author.display_name)}:' \
                       f':{clean(message.clean_content)}::\n'
-                for client in self.cfg.ch_clients[ch_id]:
-                    try:
-                        self.clients[client]['queue'].put_nowait((5, out))
-                    except KeyError:
-                        pass
-                    except asyncio.QueueFull:
-                        pass
+                # Framed clients get the fields unescaped.
+                content = convert_to(clean_emoji(message.clean_content).strip(), to_discord=False)
+                packet = Packet('MSG', ['Discord', message.author.display_name, content],
+                                text=out)
+                self.fanout(self.cfg.ch_clients[ch_id], packet)
             else:
                 msgtype = self.cfg.types[routedtype]
                 if msgtype.sendable:
@@ -171,13 +106,94 @@ class ChatRelay(commands.Cog):
                     )
                 else:
                     return
-                for client in self.clients:
-                    try:
-                        self.clients[client]['queue'].put_nowait((5, out))
-                    except KeyError:
-                        pass
-                    except asyncio.QueueFull:
-                        pass
+                values = {
+                    'client': 'Discord',
+                    'user': message.author.display_name,
+                    'content': message.clean_content.strip()
+                }
+                packet = Packet(msgtype.prefix,
+                                [values.get(field, '') for field in msgtype.formatfields],
+                                text=out)
+                self.fanout(list(self.clients), packet)
+
+    async def getprefixes(self, message):
+        """Returns the command prefixes for a message's guild as a tuple,
+        cached per guild until a prefix command is used, or for 5 minutes.
+        """
+
+        try:
+            return self.prefixes[message.guild.id]
+        except KeyError:
+            pass
+        prefix = await self.bot.get_prefix(message)
+        if isinstance(prefix, str):
+            prefixes = (prefix,)
+        else:
+            prefixes = tuple(prefix)
+        self.prefixes[message.guild.id] = prefixes
+        return prefixes
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        if 'prefix' in ctx.command.qualified_name:
+            log.debug('CR: Prefixes may have changed, clearing cache.')
+            self.prefixes.clear()
+
+    def fanout(self, clients, packet):
+        """Queues a packet for several clients, encoding it upfront,
+        once per protocol in use, so all queues share the same bytes.
+        """
+
+        for framed in {self.clients[c]['framed'] for c in clients if c in self.clients}:
+            packet.encode(framed)
+        for client in clients:
+            self.enqueue(client, packet)
+
+    def enqueue(self, client, packet, priority=5):
+        """Queues a packet to be sent to a client, if it is connected;
+        Should its queue be full, the overflow policy for the client
+        and the packet's type decides what happens to it.
+        """
+
+        try:
+            queue = self.clients[client]['queue']
+            spill = self.clients[client]['spill']
+        except KeyError:
+            return
+        stats = self.clientstats[client]
+        item = (priority, next(self.seq), packet)
+        if queue.full() or spill:
+            dropped = stats['dropped']
+            overflow(queue, item, self.cfg.policy(client, packet.prefix), stats, spill)
+            if stats['dropped'] > dropped:
+                self._dropped(f'Outqueue for {client}', stats)
+        else:
+            queue.put_nowait(item)
+        if queue.qsize() > stats['peak']:
+            stats['peak'] = queue.qsize()
+
+    def receive(self, client, packet):
+        """Queues a packet received from a client for the inqueue worker,
+        overflowing according to the policy for the client and its type.
+        """
+
+        stats = self.instats
+        self.clientstats[client]['received'] += 1
+        if self.inqueue.full() or self.inspill:
+            dropped = stats['dropped']
+            overflow(self.inqueue, (client, packet), self.cfg.policy(client, packet.prefix),
+                     stats, self.inspill)
+            if stats['dropped'] > dropped:
+                self._dropped('Incoming queue', stats)
+        else:
+            self.inqueue.put_nowait((client, packet))
+        if self.inqueue.qsize() > stats['peak']:
+            stats['peak'] = self.inqueue.qsize()
+
+    def _dropped(self, queue, stats):
+        # Warn on the first drop, and every hundredth after that.
+        if stats['dropped'] % 100 == 1:
+            log.warning(f'CR: {queue} is full, {stats["dropped"]} messages dropped so far!')
 
     @commands.group(invoke_without_command=True)
     async def chatrelay(self, ctx):
@@ -218,25 +234,44 @@ class ChatRelay(commands.Cog):
                                 f'{channel.name if channel else channel_id}{_suffix}\n')
         if len(info) == 2:
             info.append('> No clients connected, nothing configured.')
+        if self.stats:
+            info.append('\n# Relay statistics:')
+            info.append(f'{self.stats["lines"]} lines relayed in {self.stats["messages"]} messages, '
+                        f'{self.stats["merged"]} merged.')
+            info.append(f'{self.stats["dropped"]} dropped, {self.stats["failed"]} failed to send.')
+            for channel_id, pending in self.dispatcher.pending().items():
+                channel = self.bot.get_channel(channel_id)
+                info.append(f'- {channel.name if channel else channel_id}: {pending} queued')
         await ctx.sendmarkdown('\n'.join(info))
 
-    async def incoming_worker(self, reader, client):
+    async def incoming_worker(self, reader, client, framed=False):
         log.info(f'CR-Incoming: Worker for {client} started.')
         try:
             while True:
-                data = await reader.readline()
-                if not data:
-                    log.info(f'CR-Incoming: {client} appears to have disconnected!')
-                    break
-                try:
-                    data = data.decode()
-                except UnicodeDecodeError as e:
-                    log.info(f'CR-Incoming: {e}')
-                    continue
-                try:
-                    self.inqueue.put_nowait((client, data))
-                except asyncio.QueueFull:
-                    log.warning('CR-Incoming: Incoming queue full, message dropped!')
+                if framed:
+                    try:
+                        size = int.from_bytes(await reader.readexactly(4), 'big')
+                        if size > maxframe:
+                            log.warning(f'CR-Incoming: Oversized frame from {client}!')
+                            break
+                        packet = Packet.fromframe(await reader.readexactly(size))
+                    except asyncio.IncompleteReadError:
+                        log.info(f'CR-Incoming: {client} appears to have disconnected!')
+                        break
+                    except ValueError as e:
+                        log.info(f'CR-Incoming: Invalid frame from {client}: {e}')
+                        continue
+                else:
+                    data = await reader.readline()
+                    if not data:
+                        log.info(f'CR-Incoming: {client} appears to have disconnected!')
+                        break
+                    try:
+                        packet = Packet.fromtext(data.decode())
+                    except UnicodeDecodeError as e:
+                        log.info(f'CR-Incoming: {e}')
+                        continue
+                self.receive(client, packet)
         except CancelledError:
             raise
         except ConnectionResetError:
@@ -249,15 +284,28 @@ class ChatRelay(commands.Cog):
         try:
             while True:
                 try:
-                    _, data = await self.clients[client]['queue'].get()
+                    queue = self.clients[client]['queue']
+                    framed = self.clients[client]['framed']
+                    spill = self.clients[client]['spill']
+                    # Spilled packets are sent once everything queued before them is.
+                    if queue.empty() and spill:
+                        batch = [packet.encode(framed)
+                                 for _, packet in await spill.pop(self.maxbatch)]
+                    else:
+                        _, _, packet = await queue.get()
+                        batch = [packet.encode(framed)]
                 except (KeyError, AttributeError):
                     log.error(f'CR-Outgoing: Outqueue for {client} is gone!'
                               ' Connection shutting down!')
                     break
                 else:
-                    data = data.encode()
-                    writer.write(data)
+                    # Write everything queued up meanwhile in one go, and drain once.
+                    while not queue.empty() and len(batch) < self.maxbatch:
+                        _, _, packet = queue.get_nowait()
+                        batch.append(packet.encode(framed))
+                    writer.writelines(batch)
                     await writer.drain()
+                    self.clientstats[client]['sent'] += len(batch)
         except CancelledError:
             writer.close()
             raise
@@ -276,12 +324,19 @@ class ChatRelay(commands.Cog):
 
         handshake = handshake.decode()
         hshk = handshake.split('::')
+        framed = False
         if hshk[0] == 'HSHK':
             try:
                 client = hshk[1]
             except IndexError:
                 log.warning(f'CR-Connection: Invalid handshake: {handshake}')
                 client = None
+            # Clients supporting the framed protocol list it after their name,
+            # everything after the handshake is then exchanged in frames.
+            if len(hshk) > 2 and FRAMED in hshk[2].strip().split(','):
+                framed = True
+                writer.write(f'HSHK::{FRAMED}::\n'.encode())
+                await writer.drain()
         else:
             log.warning(f'CR-Connection: Invalid handshake: {handshake}')
             client = None
@@ -290,18 +345,27 @@ class ChatRelay(commands.Cog):
             log.warning('CR-Connection: Using client address as name.')
             client = peer
 
-        await self.inqueue.put((client, f'SYS::```markdown\n# {client} connected!\n```'))
+        log.info(f'CR-Connection: {client} uses the {FRAMED if framed else "text"} protocol.')
+        await self.inqueue.put((client, Packet('SYS', [f'```markdown\n# {client} connected!\n```'])))
 
         if client in self.clients and self.clients[client]:
-            if 'worker' in self.clients[client]:
+            if 'workers' in self.clients[client]:
                 log.warning(f'CR-Connection: {client} reconnecting after messy exit, cleaning up!')
                 for worker in self.clients[client]['workers']:
                     worker.cancel()
 
-        self.clients[client] = {}
-        self.clients[client]['queue'] = asyncio.PriorityQueue(maxsize=24, loop=self.loop)
-
-        in_task = self.loop.create_task(self.incoming_worker(reader, client))
+        connection = self.clients[client] = {}
+        self.clients[client]['queue'] = asyncio.PriorityQueue(
+            maxsize=self.cfg.overflow['queuesize'], loop=self.loop
+        )
+        self.clients[client]['framed'] = framed
+        # Named by hash, so no client name can clash with another's or the incoming spill.
+        spillname = hashlib.sha1(client.encode()).hexdigest()
+        self.clients[client]['spill'] = Spill(self.loop,
+                                              f'{self.spillpath}/client-{spillname}.spill',
+                                              stats=self.clientstats[client])
+
+        in_task = self.loop.create_task(self.incoming_worker(reader, client, framed))
         out_task = self.loop.create_task(self.outgoing_worker(writer, client))
 
         self.clients[client]['workers'] = (in_task, out_task)
@@ -311,65 +375,67 @@ class ChatRelay(commands.Cog):
         for task in waiting:
             task.cancel()
 
-        try:
-            baggage = self.clients.pop(client)
-        except KeyError:
-            pass
-        else:
+        # The client may have reconnected meanwhile, its new connection is left be.
+        if self.clients.get(client) is connection:
+            del self.clients[client]
             log.info(f'CR-Connection: Outqueue for {client} removed with'
-                     f' {baggage["queue"].qsize()} items.')
+                     f' {connection["queue"].qsize() + len(connection["spill"])} items.')
+            connection['spill'].clear()
+            # Only registered clients keep their statistics across connections.
+            if client not in self.cfg.client_ch:
+                self.clientstats.pop(client, None)
 
         writer.close()
         log.info(f'CR-Connection: Connection with {client} closed!')
-        await self.inqueue.put((client, f'SYS::```markdown\n< {client} disconnected! >\n```'))
+        await self.inqueue.put((client, Packet('SYS', [f'```markdown\n< {client} disconnected! >\n```'])))
 
     async def inqueue_worker(self):
         log.info('CR-Inqueue: Worker started!')
         try:
+            unspilled = deque()
             while True:
-                client, data = await self.inqueue.get()
-
-                # Check if the data has a valid format.
-                _data = data.split('::')
+                # Spilled packets are handled once everything queued before them is.
+                if unspilled:
+                    client, packet = unspilled.popleft()
+                elif self.inqueue.empty() and self.inspill:
+                    unspilled.extend(await self.inspill.pop(self.inqueue.maxsize))
+                    continue
+                else:
+                    client, packet = await self.inqueue.get()
 
+                # Check if the packet is of a valid type.
                 try:
-                    msgtype = self.cfg.types[_data[0]]
+                    msgtype = self.cfg.types[packet.prefix]
                 except KeyError:
-                    log.debug(f'CR-Inqueue: Data from {client} with invalid format: {data}')
+                    log.debug(f'CR-Inqueue: Data from {client} with invalid format: '
+                              f'{packet.prefix}: {packet.fields}')
                     continue
 
-                # If we get here, then the format represents a valid type.
+                # If we get here, then the packet represents a valid type.
                 if msgtype.sendable:
                     try:
                         others = self.cfg.ch_clients[self.cfg.client_ch[client]]
                     except KeyError:
                         log.debug(f'Could not find others for {client}!')
                     else:
-                        for other in others:
-                            if other == client:
-                                continue
-                            try:
-                                self.clients[other]['queue'].put_nowait((5, data))
-                            except KeyError:
-                                pass
-                            except asyncio.QueueFull:
-                                pass
+                        self.fanout([other for other in others if other != client], packet)
+
+                try:
+                    out = convert_to(msgtype.formatstr.format(
+                        **dict(zip(msgtype.formatfields, packet.fields))))
+                except (IndexError, KeyError) as e:
+                    log.debug(f'CR-Inqueue: {packet.prefix} from {client} is missing {e}!')
+                    continue
 
                 # Check if this is a type registered to a specific channel.
                 try:
-                    ch_id, consume = self.cfg.typerouting[_data[0]]
+                    ch_id, consume = self.cfg.typerouting[packet.prefix]
                 except KeyError:
                     pass
                 else:
                     channel = self.bot.get_channel(int(ch_id))
                     if channel:
-                        try:
-                            await channel.send(
-                                convert_to(msgtype.formatstr.format(
-                                    **dict(zip(msgtype.formatfields, _data[1:]))))
-                            )
-                        except IndexError as e:
-                            log.debug(f'{e}: {data}')
+                        self.dispatcher.push(channel, out)
                     else:
                         log.debug(f'{msgtype} set to be consumed, but channel does not exist!')
                     if consume:
@@ -379,22 +445,16 @@ class ChatRelay(commands.Cog):
                 try:
                     channel = self.bot.get_channel(int(self.cfg.client_ch[client]))
                 except KeyError:
-                    log.debug(f'CR-Inqueue: No channel for: "{client} : {data}", dropping!')
+                    log.debug(f'CR-Inqueue: No channel for: "{client} : {out}", dropping!')
                     continue
 
                 # If we get here, we might have a channel and can process according to format map.
                 if not channel:
-                    log.warning(f'CR-Inqueue: {_data[0]} message from {client} could not be sent.'
+                    log.warning(f'CR-Inqueue: {packet.prefix} message from {client} could not be sent.'
                                 ' Registered channel does not exist!')
                     continue
 
-                try:
-                    await channel.send(
-                        convert_to(msgtype.formatstr.format(
-                            **dict(zip(msgtype.formatfields, _data[1:]))))
-                    )
-                except IndexError as e:
-                    log.debug(f'{e}: {data}')
+                self.dispatcher.push(channel, out)
         except CancelledError:
             raise
         finally:
@@ -663,6 +723,118 @@ class ChatRelay(commands.Cog):
             await self.cfg.save()
             await ctx.sendmarkdown(f'# {msgtype} has been unregistered from type routing.')
 
+    @chatrelay.command(name='stats')
+    async def _stats(self, ctx):
+        """Returns queue statistics for every client.
+
+        Lists the messages received from and sent to each client,
+        the current and peak length of its queue, and how many
+        messages overflowed it, by being dropped, coalesced or
+        spilled to disk; And the same for the incoming queue
+        shared by all clients.
+
+        Queue sizes are set as 'queuesize' and 'inqueuesize'
+        in the relay config, and apply to new connections.
+        """
+
+        def overflowed(stats):
+            return (f'  {stats["dropped"]} dropped, {stats["coalesced"]} coalesced,'
+                    f' {stats["spilled"]} spilled')
+
+        info = ['# Relay queues:',
+                f'Incoming: {self.inqueue.qsize()}/{self.inqueue.maxsize} queued,'
+                f' peak {self.instats["peak"]}, {len(self.inspill)} spilled',
+                overflowed(self.instats)]
+        for client, stats in self.clientstats.items():
+            try:
+                queue = self.clients[client]['queue']
+                spill = self.clients[client]['spill']
+            except KeyError:
+                state = '< disconnected >'
+            else:
+                state = (f'{queue.qsize()}/{queue.maxsize} queued, peak {stats["peak"]},'
+                         f' {len(spill)} spilled')
+            info.append(f'\n{client}: {stats["received"]} received, {stats["sent"]} sent')
+            info.append(f'  {state}')
+            info.append(overflowed(stats))
+        await ctx.sendmarkdown('\n'.join(info))
+
+    @chatrelay.group(name='overflow', invoke_without_command=True)
+    @permission_node(f'{__name__}.register')
+    async def _overflow(self, ctx):
+        """Overflow policy commands.
+
+        Overflow policies decide what happens to messages
+        that do not fit into a full queue, they can be set
+        per client and per message type, with a type's policy
+        winning over a client's:
+
+        drop-newest: The message is dropped.
+        drop-oldest: The oldest queued message is dropped instead.
+        coalesce: The message is merged into a queued one of the
+            same type and sender, or else the oldest is dropped.
+        spill: The message is spilled to disk, and queued again
+            once there is room.
+
+        This command shows the current policies if no
+        subcommand is given.
+        """
+
+        overflow = self.cfg.overflow
+        out = ['# Overflow policies:', f'Default: {overflow["default"]}']
+        for kind in ('clients', 'types'):
+            if overflow[kind]:
+                out.append(f'\n# {kind.capitalize()}:')
+                for name, policy in overflow[kind].items():
+                    out.append(f'{name}: {policy}')
+        await ctx.sendmarkdown('\n'.join(out))
+
+    async def _setpolicy(self, ctx, kind, name, policy):
+        if policy == 'default':
+            self.cfg.overflow[kind].pop(name, None)
+        elif policy in policies:
+            self.cfg.overflow[kind][name] = policy
+        else:
+            await ctx.sendmarkdown(f'< Unknown policy! Policies are: {", ".join(policies)} >')
+            return
+        await self.cfg.save()
+        await ctx.sendmarkdown(f'# Overflow policy for {name} set to {policy}.')
+
+    @_overflow.command(name='default')
+    @permission_node(f'{__name__}.register')
+    async def _overflowdefault(self, ctx, policy: str):
+        """Sets the overflow policy for everything without a policy of its own."""
+
+        if policy not in policies:
+            await ctx.sendmarkdown(f'< Unknown policy! Policies are: {", ".join(policies)} >')
+            return
+        self.cfg.overflow['default'] = policy
+        await self.cfg.save()
+        await ctx.sendmarkdown(f'# Default overflow policy set to {policy}.')
+
+    @_overflow.command(name='client')
+    @permission_node(f'{__name__}.register')
+    async def _overflowclient(self, ctx, client: str, policy: str):
+        """Sets the overflow policy for a client.
+
+        Use 'default' as the policy to remove it again.
+        """
+
+        await self._setpolicy(ctx, 'clients', client, policy)
+
+    @_overflow.command(name='type')
+    @permission_node(f'{__name__}.register')
+    async def _overflowtype(self, ctx, msgtype: str, policy: str):
+        """Sets the overflow policy for a message type.
+
+        Use 'default' as the policy to remove it again.
+        """
+
+        if msgtype not in self.cfg.types:
+            await ctx.sendmarkdown('< Unknown message type! >')
+            return
+        await self._setpolicy(ctx, 'types', msgtype, policy)
+
     @chatrelay.command(name='cmd')
     @permission_node(f'{__name__}.cmd')
     async def _cmd(self, ctx, client, *, cmd):
@@ -673,9 +845,9 @@ class ChatRelay(commands.Cog):
         registered with the client you send the command to.
         """
 
-        out = f'CMD::{cmd}::\n'
+        out = Packet('CMD', [cmd], text=f'CMD::{cmd}::\n')
         try:
-            await self.clients[client]['queue'].put((5, out))
+            await self.clients[client]['queue'].put((5, next(self.seq), out))
         except KeyError:
             await ctx.sendmarkdown(f'< "{client}" is either unknown or not connected! >')
         except AttributeError as exc:
@@ -1,7 +1,7 @@
 from discord.ext import commands
 import logging
 from utils import Config, permission_node
-from .utils import isUp, sendCmd
+from .utils import isUp, sendCmd, fanoutCmds
 
 log = logging.getLogger('charfred')
 
@@ -48,14 +48,17 @@ class ConsoleCmds(commands.Cog):
             servers = self.servercfg['servers']
 
         msg = ['Command Log', '==========', f'> Category: {category}' if category else '']
-        for server in servers:
-            if isUp(server):
-                log.info(f'Whitelisting {player} on {server}.')
-                await sendCmd(self.loop, server, f'whitelist add {player}')
+        log.info(f'Whitelisting {player}.')
+        outcomes = await fanoutCmds(self.loop, servers, f'whitelist add {player}')
+        for server, outcome in outcomes.items():
+            if outcome == 'sent':
                 msg.append(f'# Whitelisted {player} on {server}.')
-            else:
+            elif outcome == 'offline':
                 log.warning(f'Could not whitelist {player} on {server}.')
                 msg.append(f'< Unable to whitelist {player}, {server} is offline! >')
+            else:
+                log.warning(f'Could not whitelist {player} on {server}.')
+                msg.append(f'< Unable to whitelist {player} on {server}, {outcome}! >')
         await ctx.sendmarkdown('\n'.join(msg))
 
     @whitelist.command()
@@ -77,14 +80,17 @@ class ConsoleCmds(commands.Cog):
             servers = self.servercfg['servers']
 
         msg = ['Command Log', '==========', f'> Category: {category}' if category else '']
-        for server in servers:
-            if isUp(server):
-                log.info(f'Unwhitelisting {player} on {server}.')
-                await sendCmd(self.loop, server, f'whitelist remove {player}')
+        log.info(f'Unwhitelisting {player}.')
+        outcomes = await fanoutCmds(self.loop, servers, f'whitelist remove {player}')
+        for server, outcome in outcomes.items():
+            if outcome == 'sent':
                 msg.append(f'# Unwhitelisting {player} on {server}.')
-            else:
+            elif outcome == 'offline':
                 log.warning(f'Could not unwhitelist {player} on {server}.')
                 msg.append(f'< Unable to unwhitelist {player}, {server} is offline! >')
+            else:
+                log.warning(f'Could not unwhitelist {player} on {server}.')
+                msg.append(f'< Unable to unwhitelist {player} on {server}, {outcome}! >')
         await ctx.sendmarkdown('\n'.join(msg))
 
     @whitelist.command()
@@ -215,16 +221,18 @@ class ConsoleCmds(commands.Cog):
         """Bans a player, and unwhitelists just to be safe."""
 
         msg = ['Command Log', '==========']
-        for server in self.servercfg['servers']:
-            if isUp(server):
-                log.info(f'Banning {player} on {server}.')
-                await sendCmd(self.loop, server, f'ban {player}')
-                log.info(f'Unwhitelisting {player} on {server}.')
-                await sendCmd(self.loop, server, f'whitelist remove {player}')
+        log.info(f'Banning and unwhitelisting {player}.')
+        outcomes = await fanoutCmds(self.loop, self.servercfg['servers'],
+                                    f'ban {player}', f'whitelist remove {player}')
+        for server, outcome in outcomes.items():
+            if outcome == 'sent':
                 msg.append(f'# Banned {player} from {server}.')
-            else:
+            elif outcome == 'offline':
                 log.warning(f'Could not ban {player} from {server}.')
                 msg.append(f'< Unable to ban {player}, {server} is offline! >')
+            else:
+                log.warning(f'Could not ban {player} from {server}.')
+                msg.append(f'< Unable to ban {player} from {server}, {outcome}! >')
         await ctx.sendmarkdown('\n'.join(msg))
 
     @minecraft.command(aliases=['pass'])
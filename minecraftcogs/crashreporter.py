@@ -2,8 +2,8 @@ from discord.ext import commands
 import logging
 import asyncio
 from discord import File
-from utils import permission_node
-from .utils import getcrashreport, parsereport, formatreport
+from utils import Config, permission_node
+from .utils import getcrashreport, parsereport, formatreport, CrashPrints, summarizeprint
 
 log = logging.getLogger('charfred')
 
@@ -13,6 +13,7 @@ class CrashReporter(commands.Cog):
         self.bot = bot
         self.loop = bot.loop
         self.servercfg = bot.servercfg
+        self.crashprints = bot.crashprints
 
     @commands.command(aliases=['report', 'crashreports'])
     @permission_node(f'{__name__}.report')
@@ -28,7 +29,13 @@ class CrashReporter(commands.Cog):
 
         log.info(f'Getting report for {server}.')
         serverspath = self.servercfg['serverspath']
-        rpath, _ = await self.loop.run_in_executor(None, getcrashreport, server, serverspath, nthlast)
+        try:
+            rpath, _ = await self.loop.run_in_executor(None, getcrashreport, server,
+                                                       serverspath, nthlast)
+        except IndexError:
+            log.info(f'{server} has no such crashreport.')
+            await ctx.sendmarkdown(f'< {server} has no such crashreport! >')
+            return
 
         b, _, timedout = await ctx.promptconfirm('Do you wish to download the full report?')
         if timedout:
@@ -41,14 +48,13 @@ class CrashReporter(commands.Cog):
             return
 
         log.info('Parsing report...')
-        ctime, desc, strace, flavor, level, block, phase = await self.loop.run_in_executor(
-            None, parsereport, rpath
-        )
+        report = await self.loop.run_in_executor(None, parsereport, rpath)
 
         log.info('Formatting report...')
-        chunks = await self.loop.run_in_executor(
-            None, formatreport, rpath, ctime, desc, flavor, strace, level, block, phase
-        )
+        chunks = formatreport(report)
+        fp, entry = self.crashprints.lookup(report)
+        if entry:
+            chunks[0] = f'> {summarizeprint(fp, entry)}\n' + chunks[0]
 
         for c in chunks:
             await ctx.sendmarkdown(c)
@@ -57,5 +63,8 @@ class CrashReporter(commands.Cog):
 
 
 def setup(bot):
+    if not hasattr(bot, 'crashprints'):
+        bot.crashprints = CrashPrints(Config(f'{bot.dir}/configs/crashprints.json',
+                                             load=True, loop=bot.loop))
     bot.register_nodes([f'{__name__}.report'])
     bot.add_cog(CrashReporter(bot))
@@ -3,7 +3,7 @@ from discord.utils import find
 import re
 import logging
 from utils import Config, permission_node
-from .utils import isUp, sendCmd
+from .utils import isUp, sendCmd, fanoutCmds
 
 log = logging.getLogger('charfred')
 
@@ -122,14 +122,17 @@ class Customs(commands.Cog):
         msg.append(f'# Executing \"{_cmd}\"...')
 
         if re.match('^all$', server, flags=re.I):
-            for server in self.servercfg['servers']:
-                if isUp(server):
-                    log.info(f'Executing \"{cmd}\" on {server}.')
-                    await sendCmd(self.loop, server, _cmd)
+            log.info(f'Executing \"{cmd}\" on all servers.')
+            outcomes = await fanoutCmds(self.loop, self.servercfg['servers'], _cmd)
+            for server, outcome in outcomes.items():
+                if outcome == 'sent':
                     msg.append(f'# on {server};')
-                else:
+                elif outcome == 'offline':
                     log.warning(f'Could not execute \"{cmd}\", {server} is offline!')
                     msg.append(f'< {server} is offline! >')
+                else:
+                    log.warning(f'Could not execute \"{cmd}\" on {server}, {outcome}!')
+                    msg.append(f'< {server}: {outcome}! >')
         else:
             if isUp(server):
                 log.info(f'Executing \"{cmd}\" on {server}.')
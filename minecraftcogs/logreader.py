@@ -1,10 +1,11 @@
 import logging
 import os
 import asyncio
-from time import sleep, time
-from threading import Event
+import functools
+from time import time
 from discord.ext import commands
 from utils import Config, permission_node
+from .utils import LogBus
 
 log = logging.getLogger('charfred')
 
@@ -14,8 +15,13 @@ class LogReader(commands.Cog):
         self.bot = bot
         self.loop = bot.loop
         self.servercfg = bot.servercfg
+        self.logbus = bot.logbus
         self.logfutures = {}
 
+    def cog_unload(self):
+        for logtask in self.logfutures.values():
+            logtask.cancel()
+
     @commands.group()
     @permission_node(f'{__name__}.read')
     async def log(self, ctx):
@@ -32,7 +38,7 @@ class LogReader(commands.Cog):
         it will default to 1800 seconds (30 minutes).
         """
 
-        if server in self.logfutures and not self.logfutures[server][0].done():
+        if server in self.logfutures and not self.logfutures[server].done():
             log.info(f'There\'s already a reader open for {server}\'s log!')
             await ctx.sendmarkdown('# Reader already active!')
             return
@@ -45,61 +51,60 @@ class LogReader(commands.Cog):
             await ctx.sendmarkdown(f'< Log file for {server} not found! >')
             return
 
-        def _watchlog(event):
-            timestamp = time()
-            if timeout and timeout < 1800:
-                stopwhen = timestamp + timeout
-                coro = ctx.sendmarkdown(f'# Reading log for {server} for {timeout} seconds...\n'
-                                        f'< Please run \'log endwatch {server}\' if you\'re\n'
-                                        'not actively following the log! >')
-            else:
-                stopwhen = timestamp + 1800
-                coro = ctx.sendmarkdown(f'# Reading log for {server} for 1800 seconds...\n'
-                                        f'< Please run \'log endwatch {server}\' if you\'re\n'
-                                        'not actively following the log! >')
-            asyncio.run_coroutine_threadsafe(coro, self.loop)
-            with open(self.servercfg['serverspath'] + f'/{server}/logs/latest.log', 'r') as mclog:
-                log.info(f'LW: Reading log for {server} for {timeout} seconds...')
-                mclog.seek(0, 2)
-                outlines = []
-                while not event.is_set() and time() < stopwhen:
-                    line = mclog.readline()
-                    if line and line.startswith('['):
-                        outlines.append('# ' + line if len(line) < 225 else (line[:225] + ' [...]'))
-                        if len(outlines) == 8 or (time() - timestamp) > 5:
-                            out = '\n'.join(outlines)
-                            coro = ctx.sendmarkdown(out)
-                            asyncio.run_coroutine_threadsafe(coro, self.loop)
-                            outlines = []
-                            timestamp = time()
-                            sleep(1)
-                    else:
-                        sleep(0.2)
-                return
+        sub = self.logbus.subscribe(server)
+        logtask = self.loop.create_task(self._watchlog(ctx, server, sub, timeout))
+        logtask.add_done_callback(functools.partial(self._watchDone, ctx, server))
+        self.logfutures[server] = logtask
 
-        def _watchDone(future):
-            log.info(f'LW: Done reading log for {server}!')
-            if future.exception():
-                log.warning(f'LW: Exception in log reader for {server}!')
-                log.warning(future.exception())
-                coro = ctx.sendmarkdown(f'< An exception caused the log reader for {server}\n'
-                                        'to terminate immaturely! >')
-            else:
-                coro = ctx.sendmarkdown(f'> Stopped reading log for {server}.')
-            asyncio.run_coroutine_threadsafe(coro, self.loop)
+    async def _watchlog(self, ctx, server, sub, timeout):
+        if not timeout or timeout > 1800:
+            timeout = 1800
+        await ctx.sendmarkdown(f'# Reading log for {server} for {timeout} seconds...\n'
+                               f'< Please run \'log endwatch {server}\' if you\'re\n'
+                               'not actively following the log! >')
+        log.info(f'LW: Reading log for {server} for {timeout} seconds...')
+        timestamp = time()
+        stopwhen = timestamp + timeout
+        outlines = []
+        try:
+            while time() < stopwhen:
+                try:
+                    event = await asyncio.wait_for(sub.get(), min(stopwhen - time(), 5))
+                except asyncio.TimeoutError:
+                    event = None
+                else:
+                    if event is None:
+                        break
+                if event and event.line.startswith('['):
+                    line = event.line
+                    outlines.append('# ' + line if len(line) < 225 else (line[:225] + ' [...]'))
+                if outlines and (len(outlines) == 8 or (time() - timestamp) > 5):
+                    await ctx.sendmarkdown('\n'.join(outlines))
+                    outlines = []
+                    timestamp = time()
+                    await asyncio.sleep(1, loop=self.loop)
+        finally:
+            sub.close()
 
-        event = Event()
-        logfuture = self.loop.run_in_executor(None, _watchlog, event)
-        logfuture.add_done_callback(_watchDone)
-        self.logfutures[server] = (logfuture, event)
+    def _watchDone(self, ctx, server, future):
+        log.info(f'LW: Done reading log for {server}!')
+        if future.cancelled():
+            return
+        if future.exception():
+            log.warning(f'LW: Exception in log reader for {server}!')
+            log.warning(future.exception())
+            coro = ctx.sendmarkdown(f'< An exception caused the log reader for {server}\n'
+                                    'to terminate immaturely! >')
+        else:
+            coro = ctx.sendmarkdown(f'> Stopped reading log for {server}.')
+        self.loop.create_task(coro)
 
     @log.command(aliases=['unwatch', 'stopit', 'enough'])
     async def endwatch(self, ctx, server: str):
         """Stops the reader of a given server's log."""
 
-        if server in self.logfutures and not self.logfutures[server][0].done():
-            reader = self.logfutures[server]
-            reader[1].set()
+        if server in self.logfutures and not self.logfutures[server].done():
+            self.logfutures[server].cancel()
             await ctx.sendmarkdown(f'> Stopped reading {server}\'s log!')
         else:
             if server not in self.servercfg['servers']:
@@ -117,5 +122,7 @@ def setup(bot):
         bot.servercfg = Config(f'{bot.dir}/configs/serverCfgs.toml',
                                default=default,
                                load=True, loop=bot.loop)
+    if not hasattr(bot, 'logbus'):
+        bot.logbus = LogBus(bot.servercfg, bot.loop)
     bot.register_nodes([f'{__name__}.read'])
     bot.add_cog(LogReader(bot))
@@ -1,11 +1,16 @@
 from discord.ext import commands
 from discord import Color
+import asyncio
 import logging
 import os
-import tarfile
-from shutil import rmtree
+from shutil import rmtree, disk_usage
+from time import time
 from utils import Config, permission_node, Flipbook
-from .utils import isUp
+from .utils import isUp, sendCmds, loadindex, extractmembers, RestoreJob, \
+    Snapshots, restoresnapshot, swapin, removeaside, getcatalog, \
+    diffregions, groupchunks, restorechunks, resolvearea, \
+    gfsplan, prunefiles, collectgarbage, usagetrend, parsestamp, \
+    Verifier
 
 log = logging.getLogger('charfred')
 
@@ -15,6 +20,13 @@ class ServerBackups(commands.Cog):
         self.bot = bot
         self.loop = bot.loop
         self.servercfg = bot.servercfg
+        self.usagecfg = bot.backupusage
+        self.verifier = Verifier(self.loop, self.verified,
+                                 workers=self.servercfg.get('verifyWorkers', 2),
+                                 rate=self.servercfg.get('verifyRate', 32) << 20,
+                                 settle=self.servercfg.get('verifySettle', 5) * 60)
+        self.retentiontask = self.loop.create_task(self.retentionloop())
+        self.verifytask = self.loop.create_task(self.verifyloop())
 
     @commands.group()
     @permission_node(f'{__name__}.backup')
@@ -24,22 +36,410 @@ class ServerBackups(commands.Cog):
         pass
 
     @backup.command(aliases=['listAll'])
-    async def list(self, ctx, server: str):
-        """List available backups for a specified server."""
+    async def list(self, ctx, server: str, prefix: str=None):
+        """List available backups for a specified server.
+
+        Optionally only those whose filename starts with a given prefix.
+        """
 
         if server not in self.servercfg['servers']:
             log.warning(f'{server} has been misspelled or not configured!')
             await ctx.sendmarkdown(f'< {server} has been misspelled or not configured! >')
             return
-        bpath = self.servercfg['backupspath']
-        availablebackups = [archive for archive in os.listdir(f'{bpath}/{server}')
-                            if os.path.isfile(f'{bpath}/{server}/{archive}') and
-                            archive.endswith('.tar.gz')]
-        availablebackups.sort()
+        catalog = getcatalog(server, self.servercfg['backupspath'])
+        backups = await self.loop.run_in_executor(None, catalog.query, prefix)
+        self.verifier.schedule(server, catalog)
+        availablebackups = []
+        for name, entry in backups:
+            line = f'{name} ({entry["size"] / 1048576:.0f} MiB'
+            if entry.get('error'):
+                line += ', CORRUPTED'
+            elif entry['checksum']:
+                line += f', {entry["members"]} files, {", ".join(entry["worlds"])}'
+            availablebackups.append(line + ')')
         backupsbook = Flipbook(ctx, availablebackups, entries_per_page=8,
                                title=f'Backups for {server}', color=Color.blurple())
         await backupsbook.flip()
 
+    @backup.command()
+    async def diff(self, ctx, server: str, backup: str, world: str=None):
+        """Lists the regions of a world that differ from a backup.
+
+        Compares the chunk timestamps in the headers of all region
+        files within the backup to the live ones; Regions listed as
+        changed can be restored with 'apply partial <server> <backup> changed'.
+        """
+
+        backupfile = self.getbackupfile(server, backup)
+        if backupfile is None:
+            log.warning(f'{backup} did not match any backups for {server}!')
+            await ctx.sendmarkdown(f'< {backup} did not match any backups for {server}! >')
+            return
+        if world is None:
+            world = self.servercfg['servers'][server]['worldname']
+        await ctx.sendmarkdown(f'> Comparing {world} to {os.path.basename(backupfile)}...')
+        try:
+            changed, liveonly = await self.loop.run_in_executor(
+                None, diffregions, backupfile,
+                f'{self.servercfg["serverspath"]}/{server}', world
+            )
+        except Exception as e:
+            log.error(f'{e}\nDiff of {backupfile} failed!')
+            await ctx.sendmarkdown(f'< Comparing to {backup} failed: {e} >')
+            return
+        lines = []
+        for region, chunks in sorted(changed.items()):
+            if chunks is None:
+                lines.append(f'{region}: missing from live world')
+            else:
+                lines.append(f'{region}: {len(chunks)} chunks differ')
+        lines.extend(f'{region}: not in backup' for region in liveonly)
+        if not lines:
+            await ctx.sendmarkdown(f'# {world} does not differ from the backup!')
+            return
+        diffbook = Flipbook(ctx, lines, entries_per_page=12,
+                            title=f'{len(changed)} regions of {world} changed',
+                            color=Color.blurple())
+        await diffbook.flip()
+
+    async def verified(self, server, name, result):
+        if not result['error']:
+            log.info(f'VF: {name} verified.')
+            return
+        log.error(f'VF: {name} failed verification: {result["error"]}')
+        channel = self.bot.get_channel(int(self.servercfg.get('backupAlertChannel', 0)))
+        if channel:
+            await channel.send(f'```markdown\n< Backup {name} of {server} failed verification! >\n'
+                               f'{result["error"]}\n```')
+        else:
+            log.warning('VF: No channel to alert about failed verification!')
+
+    async def verifyloop(self):
+        await self.bot.wait_until_ready()
+        while True:
+            if os.path.isdir(self.servercfg['backupspath']):
+                for server in list(self.servercfg['servers']):
+                    catalog = getcatalog(server, self.servercfg['backupspath'])
+                    try:
+                        await self.loop.run_in_executor(None, catalog.refresh)
+                    except OSError as e:
+                        log.warning(f'VF: Could not catalog backups of {server}: {e}')
+                        continue
+                    self.verifier.schedule(server, catalog)
+            await asyncio.sleep(self.servercfg.get('verifyInterval', 30) * 60)
+
+    @backup.command()
+    @permission_node(f'{__name__}.verify')
+    async def verify(self, ctx, server: str, backup: str=None):
+        """Verifies a server's backups, or one specific backup, again.
+
+        Backups are verified in the background, failed verifications are
+        reported to the channel set up with 'backup alerts'.
+        """
+
+        if server not in self.servercfg['servers']:
+            log.warning(f'{server} has been misspelled or not configured!')
+            await ctx.sendmarkdown(f'< {server} has been misspelled or not configured! >')
+            return
+        catalog = getcatalog(server, self.servercfg['backupspath'])
+        if backup:
+            backupfile = catalog.match(backup)
+            if backupfile is None:
+                log.warning(f'{backup} did not match any backups for {server}!')
+                await ctx.sendmarkdown(f'< {backup} did not match any backups for {server}! >')
+                return
+            names = [os.path.basename(backupfile)]
+        else:
+            names = [name for name, _ in await self.loop.run_in_executor(None, catalog.query)]
+        count = self.verifier.schedule(server, catalog, names)
+        await ctx.sendmarkdown(f'# Queued {count} backups for verification!')
+
+    @backup.command()
+    @permission_node(f'{__name__}.verify')
+    async def alerts(self, ctx):
+        """Sets this channel to receive alerts about corrupted backups."""
+
+        self.servercfg['backupAlertChannel'] = ctx.channel.id
+        await self.servercfg.save()
+        await ctx.sendmarkdown(f'# Backup alerts will be sent to {ctx.channel.name}!')
+
+    def cog_unload(self):
+        self.verifier.stop()
+        self.retentiontask.cancel()
+        self.verifytask.cancel()
+
+    def getpolicy(self, server):
+        """Returns a server's retention policy, falling back to keeping
+        everything younger than 'oldTimer' minutes.
+        """
+
+        policy = self.servercfg['servers'][server].get('retention')
+        if policy:
+            return policy
+        return {'keep': 1, 'within': int(self.servercfg['oldTimer']) * 60}
+
+    def planretention(self, server):
+        policy = self.getpolicy(server)
+        catalog = getcatalog(server, self.servercfg['backupspath'])
+        backups = [(name, entry['timestamp'], entry['size'])
+                   for name, entry in catalog.query()]
+        keep, prune = gfsplan(backups, policy)
+        snapshots = Snapshots(self.servercfg['backupspath'], server)
+        _, snapprune = gfsplan([(name, parsestamp(name, 0), 0) for name in snapshots.list()],
+                               policy)
+        return catalog, keep, prune, snapshots, [name for name, _, _ in snapprune]
+
+    def applyretention(self, server):
+        """Prunes a server's backups and snapshots according to its policy.
+
+        Returns the number of backups and snapshots pruned and bytes freed.
+        """
+
+        catalog, _, prune, snapshots, snapprune = self.planretention(server)
+        freed = prunefiles([os.path.join(catalog.path, name) for name, _, _ in prune])
+        if snapprune:
+            snapshots.remove(snapprune)
+            freed += collectgarbage(self.servercfg['backupspath'])
+        return len(prune), len(snapprune), freed
+
+    def measureusage(self):
+        """Returns the total size of each server's backups, and the
+        free and total space on the backup volume.
+        """
+
+        sizes = {}
+        for server in self.servercfg['servers']:
+            catalog = getcatalog(server, self.servercfg['backupspath'])
+            sizes[server] = sum(entry['size'] for _, entry in catalog.query())
+        disk = disk_usage(self.servercfg['backupspath'])
+        return sizes, disk.free, disk.total
+
+    async def recordusage(self):
+        sizes, free, total = await self.loop.run_in_executor(None, self.measureusage)
+        now = time()
+        servers = self.usagecfg.get('servers', {})
+        for server, size in sizes.items():
+            samples = servers.get(server, [])
+            samples.append([now, size])
+            servers[server] = samples[-1000:]
+        self.usagecfg['servers'] = servers
+        self.usagecfg['disk'] = [now, free, total]
+        await self.usagecfg.save()
+
+    async def retentionloop(self):
+        await self.bot.wait_until_ready()
+        while True:
+            if os.path.isdir(self.servercfg['backupspath']):
+                for server, cfg in list(self.servercfg['servers'].items()):
+                    if not cfg.get('autoPrune'):
+                        continue
+                    try:
+                        pruned, snaps, freed = await self.loop.run_in_executor(
+                            None, self.applyretention, server
+                        )
+                    except Exception as e:
+                        log.error(f'RT: Retention for {server} failed: {e}')
+                        continue
+                    if pruned or snaps:
+                        log.info(f'RT: Pruned {pruned} backups and {snaps} snapshots '
+                                 f'of {server}, {freed / 1048576:.0f} MiB freed.')
+                try:
+                    await self.recordusage()
+                except Exception as e:
+                    log.error(f'RT: Recording backup usage failed: {e}')
+            await asyncio.sleep(self.servercfg.get('retentionInterval', 60) * 60)
+
+    @backup.command()
+    async def retention(self, ctx, server: str=None):
+        """Shows what the retention policy would prune.
+
+        For a specified server, or for all servers.
+        """
+
+        servers = [server] if server else list(self.servercfg['servers'])
+        lines = []
+        total = 0
+        for s in servers:
+            if s not in self.servercfg['servers']:
+                await ctx.sendmarkdown(f'< {s} has been misspelled or not configured! >')
+                return
+            _, keep, prune, _, snapprune = await self.loop.run_in_executor(
+                None, self.planretention, s
+            )
+            reclaimable = sum(size for _, _, size in prune)
+            total += reclaimable
+            policy = ', '.join(f'{k}: {v}' for k, v in self.getpolicy(s).items())
+            if not self.servercfg['servers'][s].get('autoPrune'):
+                policy += ', not pruned automatically'
+            lines.append(f'# {s} ({policy})\n'
+                         f'Keeping {len(keep)}, pruning {len(prune)} backups '
+                         f'and {len(snapprune)} snapshots, '
+                         f'{reclaimable / 1048576:.0f} MiB reclaimable.')
+        lines.append(f'> {total / 1048576:.0f} MiB reclaimable in total.')
+        await ctx.sendmarkdown('\n'.join(lines))
+
+    @backup.command()
+    @permission_node(f'{__name__}.retention')
+    async def policy(self, ctx, server: str, hourly: int, daily: int,
+                     weekly: int, monthly: int, keep: int=1):
+        """Sets a server's grandfather-father-son retention policy.
+
+        Of each of the last 'hourly' hours, 'daily' days, 'weekly' weeks and
+        'monthly' months the newest backup is kept, as are the newest 'keep'
+        backups; All others are pruned with 'backup prune', or by the background
+        retention task, if enabled with 'backup autoprune'.
+        Servers without a policy keep everything younger than 'oldTimer'.
+        """
+
+        if server not in self.servercfg['servers']:
+            log.warning(f'{server} has been misspelled or not configured!')
+            await ctx.sendmarkdown(f'< {server} has been misspelled or not configured! >')
+            return
+        self.servercfg['servers'][server]['retention'] = {
+            'keep': max(keep, 1), 'hourly': hourly, 'daily': daily,
+            'weekly': weekly, 'monthly': monthly
+        }
+        await self.servercfg.save()
+        await ctx.sendmarkdown(f'# Retention policy for {server} saved!')
+
+    @backup.command()
+    @permission_node(f'{__name__}.retention')
+    async def autoprune(self, ctx, server: str, enable: bool=True):
+        """Enables or disables automatic pruning of a server's backups.
+
+        Automatic pruning is off by default; Check what would be
+        pruned with 'backup retention' before enabling it.
+        """
+
+        if server not in self.servercfg['servers']:
+            log.warning(f'{server} has been misspelled or not configured!')
+            await ctx.sendmarkdown(f'< {server} has been misspelled or not configured! >')
+            return
+        self.servercfg['servers'][server]['autoPrune'] = enable
+        await self.servercfg.save()
+        if enable:
+            await ctx.sendmarkdown(f'# Backups of {server} will be pruned automatically!')
+        else:
+            await ctx.sendmarkdown(f'# Automatic pruning disabled for {server}.')
+
+    @backup.command()
+    @permission_node(f'{__name__}.retention')
+    async def prune(self, ctx, server: str):
+        """Prunes a server's backups according to its retention policy now."""
+
+        if server not in self.servercfg['servers']:
+            log.warning(f'{server} has been misspelled or not configured!')
+            await ctx.sendmarkdown(f'< {server} has been misspelled or not configured! >')
+            return
+        _, _, prune, _, snapprune = await self.loop.run_in_executor(
+            None, self.planretention, server
+        )
+        if not prune and not snapprune:
+            await ctx.sendmarkdown(f'# Nothing to prune for {server}!')
+            return
+        names = [name for name, _, _ in prune]
+        if len(names) > 20:
+            names = names[:20] + [f'...and {len(names) - 20} more']
+        await ctx.sendmarkdown(f'{len(prune)} backups and {len(snapprune)} snapshots '
+                               'will be deleted:\n' + '\n'.join(names))
+        r, _, timedout = await ctx.promptconfirm('Would you like to proceed?')
+        if timedout or not r:
+            return
+        pruned, snaps, freed = await self.loop.run_in_executor(
+            None, self.applyretention, server
+        )
+        await ctx.sendmarkdown(f'# Pruned {pruned} backups and {snaps} snapshots, '
+                               f'{freed / 1048576:.0f} MiB freed!')
+
+    @backup.command()
+    async def usage(self, ctx):
+        """Shows backup disk usage and how it is trending."""
+
+        if not os.path.isdir(self.servercfg['backupspath']):
+            await ctx.sendmarkdown('< The backups path has not been configured! >')
+            return
+        await self.recordusage()
+        _, free, total = self.usagecfg['disk']
+        lines = []
+        growth = 0
+        for server in self.servercfg['servers']:
+            samples = self.usagecfg['servers'].get(server)
+            if not samples:
+                continue
+            trend = usagetrend(samples)
+            size = samples[-1][1] / 1048576
+            if trend is None:
+                lines.append(f'{server}: {size:.0f} MiB')
+            else:
+                growth += trend
+                lines.append(f'{server}: {size:.0f} MiB, {trend / 1048576:+.0f} MiB/day')
+        lines.append(f'> {free / 1073741824:.1f} of {total / 1073741824:.1f} GiB free')
+        if growth > 0:
+            lines.append(f'> At the current rate, full in {free / growth:.0f} days!')
+        await ctx.sendmarkdown('\n'.join(lines))
+
+    def getbackupfile(self, server, part):
+        return getcatalog(server, self.servercfg['backupspath']).match(part)
+
+    def getworlds(self, server):
+        cfg = self.servercfg['servers'][server]
+        return [cfg['worldname']] + cfg.get('moreworlds', [])
+
+    @backup.command()
+    @permission_node(f'{__name__}.snapshot')
+    async def snapshot(self, ctx, server: str):
+        """Takes an incremental snapshot of a server's worlds.
+
+        Snapshots are content-addressed; Only region chunks and
+        file blocks that are not already part of an earlier snapshot,
+        of any server, take up additional space.
+        If the server is running, saving is paused for the duration.
+        """
+
+        if server not in self.servercfg['servers']:
+            log.warning(f'{server} has been misspelled or not configured!')
+            await ctx.sendmarkdown(f'< {server} has been misspelled or not configured! >')
+            return
+        snapshots = Snapshots(self.servercfg['backupspath'], server)
+        serverdir = f'{self.servercfg["serverspath"]}/{server}'
+        up = isUp(server)
+        if up:
+            log.info(f'Pausing saving on {server} for snapshot...')
+            await sendCmds(self.loop, server, 'save-off', 'save-all flush')
+            await asyncio.sleep(10)
+        await ctx.sendmarkdown(f'> Taking snapshot of {server}...')
+        try:
+            name, manifest = await self.loop.run_in_executor(
+                None, snapshots.take, serverdir, self.getworlds(server)
+            )
+        except Exception as e:
+            log.error(f'{e}\nSnapshot of {server} failed!')
+            await ctx.sendmarkdown(f'< Snapshot of {server} failed: {e} >')
+            return
+        finally:
+            if up:
+                await sendCmds(self.loop, server, 'save-on')
+        stats = manifest['stats']
+        await ctx.sendmarkdown(
+            f'# Snapshot {name} taken!\n'
+            f'{stats["files"]} files, {stats["read"] / 1048576:.1f} MiB read, '
+            f'{stats["written"] / 1048576:.1f} MiB new, '
+            f'{stats["reused"] / 1048576:.1f} MiB unchanged.'
+        )
+
+    @backup.command()
+    async def snapshots(self, ctx, server: str):
+        """List available snapshots for a specified server."""
+
+        if server not in self.servercfg['servers']:
+            log.warning(f'{server} has been misspelled or not configured!')
+            await ctx.sendmarkdown(f'< {server} has been misspelled or not configured! >')
+            return
+        available = Snapshots(self.servercfg['backupspath'], server).list()
+        snapshotbook = Flipbook(ctx, available, entries_per_page=8,
+                                title=f'Snapshots for {server}', color=Color.blurple())
+        await snapshotbook.flip()
+
     @backup.group()
     @permission_node(f'{__name__}.apply')
     async def apply(self, ctx):
@@ -47,21 +447,13 @@ class ServerBackups(commands.Cog):
 
         pass
 
-    def getbackupfile(self, server, part):
-        bpath = self.servercfg['backupspath']
-        backup = [file for file in os.listdir(f'{bpath}/{server}')
-                  if os.path.isfile(f'{bpath}/{server}/{file}') and
-                  file.endswith('.tar.gz') and part in file]
-        if len(backup) > 1:
-            return None
-        else:
-            return f'{bpath}/{server}/{backup[0]}'
-
     @apply.command()
     async def full(self, ctx, server: str, backup: str, world: str=None):
         """Applies a full world backup.
 
-        All world files currently in place will be overwritten.
+        All world files currently in place will be overwritten;
+        They are only moved aside once the backup was fully unpacked,
+        and deleted after.
 
         The 'backup' argument takes the filename for the backup
         to be used, NOT the path to it!;
@@ -89,26 +481,150 @@ class ServerBackups(commands.Cog):
             serverpath = self.servercfg['serverspath']
             if world is None:
                 world = self.servercfg['servers'][server]['worldname']
-            worldpath = f'{serverpath}/{server}/{world}'
+            log.info(f'Restoring {backupfile} for {server}...')
+            progress = await ctx.sendmarkdown('> Restoring, this might take some time...',
+                                              deletable=False)
+            job = RestoreJob(backupfile, f'{serverpath}/{server}')
+            restore = self.loop.run_in_executor(None, job.run)
+            while not restore.done():
+                await asyncio.wait([restore], timeout=5)
+                await progress.edit(content=f'```markdown\n{job.progress()}\n```')
             try:
-                log.info(f'Deleting {worldpath}')
-                rmtree(worldpath)
+                restored = restore.result()
             except Exception as e:
-                log.error(e + '\nBackup application failed!')
+                log.error(f'{e}\nBackup application failed!')
+                await ctx.sendmarkdown(f'< Backup application failed: {e} >\n'
+                                       '> The world currently in place was left untouched.')
                 return
-            else:
-                log.info(f'{worldpath} deleted!')
-                await ctx.sendmarkdown('This next step might take some time...')
+            if world not in restored:
+                log.warning(f'{world} was not part of {backupfile}!')
+                await ctx.sendmarkdown(f'< {world} was not part of the backup! >')
+            log.info('Backup extracted and placed, deleting replaced files...')
+            await ctx.sendmarkdown('World folder replaced, cleaning up...')
+            await self.loop.run_in_executor(None, job.cleanup)
+            log.info('Replaced files deleted!')
+            await ctx.sendmarkdown('Replaced: ' + ', '.join(restored) + '\nJob done!')
+        else:
+            log.info('Aborted!')
 
-                def extracthelper():
-                    with tarfile.open(backupfile, 'r:gz') as tf:
-                        tf.extractall(f'{serverpath}/{server}/')
+    @apply.command(name='snapshot')
+    async def applysnapshot(self, ctx, server: str, snapshot: str):
+        """Applies a snapshot.
 
-                await self.loop.run_in_executor(None, extracthelper)
-                log.info('World folder extracted from backup and placed!')
-                await ctx.sendmarkdown('World folder replaced, job done!')
-        else:
+        All worlds that are part of the snapshot will be replaced;
+        They are only moved aside once the snapshot was fully rebuilt,
+        and deleted after.
+
+        Any unique part of the snapshot name will suffice,
+        such as the date of it.
+        """
+
+        snapshots = Snapshots(self.servercfg['backupspath'], server)
+        name = snapshots.find(snapshot)
+        if name is None:
+            log.warning(f'{snapshot} did not match any snapshots for {server}!')
+            await ctx.sendmarkdown(f'< {snapshot} did not match any snapshots for {server}! >')
+            return
+        log.info(f'Preparing for snapshot application using {name}!')
+        await ctx.sendmarkdown(f'Using snapshot {name}')
+        r, _, timedout = await ctx.promptconfirm('Would you like to proceed?')
+        if timedout:
+            return
+        if not r:
+            log.info('Aborted!')
+            return
+        log.info('Confirmed!')
+        if isUp(server):
+            log.warning(f'{server} still up, cannot proceed!')
+            await ctx.sendmarkdown(f'{server} is still up, cannot proceed!')
+            return
+        serverdir = os.path.abspath(f'{self.servercfg["serverspath"]}/{server}')
+        staging = f'{serverdir}/.snapshot-{name}'
+
+        def restore():
+            try:
+                restoresnapshot(snapshots.load(name), snapshots.store, staging)
+                return swapin(staging, serverdir)
+            finally:
+                rmtree(staging, ignore_errors=True)
+
+        await ctx.sendmarkdown('> Rebuilding snapshot, this might take some time...')
+        try:
+            restored, aside = await self.loop.run_in_executor(None, restore)
+        except Exception as e:
+            log.error(f'{e}\nSnapshot application failed!')
+            await ctx.sendmarkdown(f'< Snapshot application failed: {e} >\n'
+                                   '> The world currently in place was left untouched.')
+            return
+        await ctx.sendmarkdown('Worlds replaced, cleaning up...')
+        await self.loop.run_in_executor(None, removeaside, aside)
+        log.info(f'Snapshot {name} applied to {server}!')
+        await ctx.sendmarkdown('Replaced: ' + ', '.join(restored) + '\nJob done!')
+
+    async def applychunks(self, ctx, server, backup, regions):
+        backupfile = self.getbackupfile(server, backup)
+        if backupfile is None:
+            log.warning(f'{backup} did not match any backups for {server}!')
+            await ctx.sendmarkdown(f'< {backup} did not match any backups for {server}! >')
+            return
+        count = sum(len(chunks) for chunks in regions.values())
+        log.info(f'Preparing for chunk restore of {count} chunks using {backupfile}!')
+        await ctx.sendmarkdown(f'Using {backupfile}\n' +
+                               f'{count} chunks in the following regions will be restored:\n' +
+                               '\n'.join(regions))
+        r, _, timedout = await ctx.promptconfirm('Would you like to proceed?')
+        if timedout:
+            return
+        if not r:
             log.info('Aborted!')
+            return
+        log.info('Confirmed!')
+        if isUp(server):
+            log.warning(f'{server} still up, cannot proceed!')
+            await ctx.sendmarkdown(f'{server} is still up, cannot proceed!')
+            return
+        world = self.servercfg['servers'][server]['worldname']
+        try:
+            missing, written = await self.loop.run_in_executor(
+                None, restorechunks, backupfile,
+                f'{self.servercfg["serverspath"]}/{server}', world, regions
+            )
+        except Exception as e:
+            log.error(f'{e}\nChunk restore failed!')
+            await ctx.sendmarkdown(f'< Chunk restore failed: {e} >')
+            return
+        if missing:
+            await ctx.sendmarkdown('< The following regions are not in the backup! >\n' +
+                                   '\n'.join(missing))
+        log.info(f'Chunks restored, {written} bytes written!')
+        await ctx.sendmarkdown(f'Chunks replaced, {written / 1024:.0f} KiB written, job done!')
+
+    @apply.command()
+    async def chunks(self, ctx, server: str, backup: str, *chunks):
+        """Applies a partial world backup,
+        replacing only specified chunks.
+
+        Only the specified chunks within the live region files are
+        overwritten, the rest of each region file is left as is.
+
+        The 'backup' argument takes the filename for the backup
+        to be used, NOT the path to it!;
+        However you do not need to put in the whole file name,
+        any unique part of the file name will suffice,
+        such as the datetime stamp of it.
+
+        The 'chunks' argument takes one or many chunk coordinates,
+        as 'x,z' pairs, such as '12,-4'.
+        """
+
+        try:
+            coords = [tuple(int(c) for c in chunk.split(',')) for chunk in chunks]
+        except ValueError:
+            coords = []
+        if not coords or any(len(c) != 2 for c in coords):
+            await ctx.sendmarkdown('< Chunks need to be given as x,z pairs, such as 12,-4! >')
+            return
+        await self.applychunks(ctx, server, backup, groupchunks(coords))
 
     @apply.command()
     async def partial(self, ctx, server: str, backup: str, *regions):
@@ -126,8 +642,28 @@ class ServerBackups(commands.Cog):
 
         The 'regions' argument takes one or many region file names;
         These need to be full filenames, such as 'r.1.1.mca'.
+        Alternatively 'changed' selects all regions that differ
+        between the backup and the live world, see 'backup diff'.
+
+        Instead of regions, an area of block coordinates may be given,
+        either as 'x1 z1 x2 z2' for a box, or as the x and z of three or
+        more corners of a polygon; Only the chunks within that area
+        will then be restored, see 'apply chunks'.
         """
 
+        try:
+            coords = [int(r) for r in regions]
+        except ValueError:
+            coords = None
+        if coords:
+            try:
+                area = resolvearea(coords)
+            except ValueError as e:
+                await ctx.sendmarkdown(f'< {e} >')
+                return
+            await self.applychunks(ctx, server, backup, area)
+            return
+
         backupfile = self.getbackupfile(server, backup)
         if backupfile is None:
             log.warning(f'{backup} did not match any backups for {server}!')
@@ -135,6 +671,17 @@ class ServerBackups(commands.Cog):
             return
         log.info(f'Preparing for partial backup application using {backupfile}!')
         await ctx.sendmarkdown(f'Using {backupfile}')
+        serverpath = self.servercfg['serverspath']
+        world = self.servercfg['servers'][server]['worldname']
+        if regions == ('changed',):
+            await ctx.sendmarkdown('> Comparing backup to the live world...')
+            changed, _ = await self.loop.run_in_executor(
+                None, diffregions, backupfile, f'{serverpath}/{server}', world
+            )
+            if not changed:
+                await ctx.sendmarkdown('No regions differ from the backup, nothing to do!')
+                return
+            regions = sorted(changed)
         log.info('Regions to be extracted:')
         for r in regions:
             log.info(r)
@@ -149,17 +696,26 @@ class ServerBackups(commands.Cog):
                 log.warning(f'{server} still up, cannot proceed!')
                 await ctx.sendmarkdown(f'{server} is still up, cannot proceed!')
                 return
-            serverpath = self.servercfg['serverspath']
-            world = self.servercfg['servers'][server]['worldname']
             regionpath = f'{serverpath}/{server}/{world}/region'
+            await ctx.sendmarkdown('Checking backup contents...')
+            index = await self.loop.run_in_executor(None, loadindex, backupfile)
+            missing = [r for r in regions if f'{world}/region/{r}' not in index['members']]
+            if missing:
+                log.warning('Regions missing from backup, aborting!')
+                await ctx.sendmarkdown('< The following regions are not in the backup, aborting! >\n' +
+                                       '\n'.join(missing))
+                return
             deleted = []
             failed = False
             for r in regions:
                 try:
                     os.remove(f'{regionpath}/{r}')
                     log.info(f'Deleting {regionpath}/{r}')
+                except FileNotFoundError:
+                    log.info(f'{regionpath}/{r} does not exist, nothing to delete.')
+                    deleted.append(r)
                 except Exception as e:
-                    log.error(e + f'\nDeletion of {r} failed!')
+                    log.error(f'{e}\nDeletion of {r} failed!')
                     failed = True
                     await ctx.sendmarkdown(f'Deletion of {r} failed!')
                 else:
@@ -178,12 +734,16 @@ class ServerBackups(commands.Cog):
                 await ctx.sendmarkdown('All specified regions successfully '
                                        'deleted! Continuing with replacement...')
 
-            def extracthelper():
-                with tarfile.open(backupfile, 'r:gz') as tf:
-                    for r in regions:
-                        tf.extract(f'{world}/region/{r}', path=f'{serverpath}/{server}')
-
-            await self.loop.run_in_executor(None, extracthelper)
+            missing = await self.loop.run_in_executor(
+                None, extractmembers, backupfile,
+                [f'{world}/region/{r}' for r in deleted], f'{serverpath}/{server}'
+            )
+            if missing:
+                log.error('Regions could not be extracted from backup:\n' + '\n'.join(missing))
+                await ctx.sendmarkdown('< The following regions could not be extracted from the '
+                                       'backup and are now missing from the world! >\n' +
+                                       '\n'.join(missing))
+                return
             log.info('Regions extracted from backup and placed!')
             await ctx.sendmarkdown('Regions replaced, job done!')
         else:
@@ -198,6 +758,9 @@ def setup(bot):
         bot.servercfg = Config(f'{bot.dir}/configs/serverCfgs.toml',
                                default=default,
                                load=True, loop=bot.loop)
-    permission_nodes = ['backup', 'apply']
+    if not hasattr(bot, 'backupusage'):
+        bot.backupusage = Config(f'{bot.dir}/configs/backupusage.json',
+                                 load=True, loop=bot.loop)
+    permission_nodes = ['backup', 'snapshot', 'retention', 'verify', 'apply']
     bot.register_nodes([f'{__name__}.{node}' for node in permission_nodes])
     bot.add_cog(ServerBackups(bot))
@@ -3,7 +3,7 @@ import asyncio
 import logging
 from utils import Config, permission_node
 from .utils import isUp, sendCmd, sendCmds, serverStart, \
-    serverStop, serverTerminate, serverStatus, buildCountdownSteps
+    serverStop, serverTerminate, serverStatus, buildCountdownSteps, serverprocs
 
 log = logging.getLogger('charfred')
 
@@ -13,6 +13,9 @@ class ServerCmds(commands.Cog):
         self.bot = bot
         self.loop = bot.loop
         self.servercfg = bot.servercfg
+        if 'processTTL' not in self.servercfg:
+            self.servercfg['processTTL'] = 10
+        serverprocs.ttl = self.servercfg['processTTL']
 
     @commands.group(invoke_without_command=True)
     @permission_node(f'{__name__}.status')
@@ -2,14 +2,17 @@ from discord.ext import commands
 from discord.utils import find
 import asyncio
 import logging
+import os
 import re
 from time import strftime, localtime, time
-from threading import Event
 from utils import Config, permission_node
-from .utils import isUp, getProc, serverStart, getcrashreport, parsereport, formatreport
+from .utils import isUp, serverStart, getcrashreport, parsereport, formatreport, \
+    LogBus, Supervisor, CrashPrints, summarizeprint
 
 log = logging.getLogger('charfred')
 
+crashsavedpat = re.compile(r'crash report has been saved to: (?P<rpath>.+)$', flags=re.I)
+
 cronpat = re.compile(r'^(?P<disabled>#)*((?P<reboot>@reboot)|(?P<min>(\*/\d+|\*|(\d+,?)+))\s(?P<hour>(\*/\d+|\*|(\d+,?)+))\s(?P<day>(\*/\d+|\*|(\d+,?)+)))\s.*spiffy\s(?P<cmd>\w+)\s(?P<server>\w+)\s(?P<args>.*)>>')
 every = '*/'
 always = '*'
@@ -20,16 +23,38 @@ class Watchdog(commands.Cog):
         self.bot = bot
         self.loop = bot.loop
         self.servercfg = bot.servercfg
+        self.logbus = bot.logbus
+        self.supervisor = bot.supervisor
+        self.crashprints = bot.crashprints
         self.watchdogs = {}
+        self.crashlisteners = {}
+        self.crashpaths = {}
         self.watchcfg = Config(f'{bot.dir}/configs/watchcfg.json',
                                load=True, loop=self.loop)
         if 'notify' not in self.watchcfg:
             self.watchcfg['notify'] = '@here'
 
     def cog_unload(self):
-        if self.watchdogs:
-            for fut, event in self.watchdogs.values():
-                event.set()
+        for server in self.watchdogs:
+            self.supervisor.unwatch(server)
+        for listener in self.crashlisteners.values():
+            listener.cancel()
+
+    async def _crashlistener(self, server):
+        """Remembers the crashreports a server announces in its log,
+        sparing the watchdog from searching for them.
+        """
+
+        sub = self.logbus.subscribe(server, pattern=crashsavedpat)
+        try:
+            async for event in sub:
+                rpath = crashsavedpat.search(event.message).group('rpath').strip()
+                if not os.path.isabs(rpath):
+                    rpath = os.path.join(self.servercfg['serverspath'], server, rpath)
+                log.info(f'WD: {server} saved a crashreport: {rpath}')
+                self.crashpaths[server] = (rpath, time())
+        finally:
+            sub.close()
 
     @commands.group(invoke_without_command=True)
     @permission_node(f'{__name__}.watchdog')
@@ -40,8 +65,8 @@ class Watchdog(commands.Cog):
         if no subcommand was given.
         """
 
-        for server, wd in self.watchdogs.items():
-            if wd[0].done():
+        for server in self.watchdogs:
+            if not self.supervisor.isWatched(server):
                 await ctx.sendmarkdown(f'< {server} watchdog inactive! >')
             else:
                 await ctx.sendmarkdown(f'# {server} watchdog active!')
@@ -66,7 +91,7 @@ class Watchdog(commands.Cog):
             log.warning('Role could not be found, role to mention unchanged.')
 
     async def _wdstart(self, ctx, server):
-        if server in self.watchdogs and not self.watchdogs[server][0].done():
+        if self.supervisor.isWatched(server):
             log.info(f'{server} watchdog active.')
             await ctx.sendmarkdown('# Watchdog already active!')
         else:
@@ -82,12 +107,13 @@ class Watchdog(commands.Cog):
                 log.info('Starting watchdog on offline server.')
                 await ctx.sendmarkdown(f'< {server} is not running. >', deletable=False)
 
-            async def serverGone(crashed, report=None):
+            async def serverGone(crashed, report=None, known=None):
                 if crashed:
                     await ctx.send(
                         f'{self.watchcfg["notify"]}\n'
                         '```markdown\n'
-                        f'< {strftime("%H:%M", localtime())} : {server} crashed! >\n'
+                        f'< {strftime("%H:%M", localtime())} : {server} crashed! >\n' +
+                        (f'> {known}\n' if known else '') +
                         '```',
                         deletable=False
                     )
@@ -102,9 +128,6 @@ class Watchdog(commands.Cog):
                 await ctx.sendmarkdown('# ' + strftime("%H:%M") + f' {server} is back online!\n'
                                        '> Continuing watch!', deletable=False)
 
-            async def watchGone():
-                await ctx.sendmarkdown(f'> Ended watch on {server}!', deletable=False)
-
             async def startServer():
                 # TODO: Remove message informing about the change from 'react to restart' to 'react to abort'
                 abortPrompt = await ctx.sendmarkdown(
@@ -140,58 +163,62 @@ class Watchdog(commands.Cog):
                     await abortPrompt.clear_reactions()
                     await abortPrompt.edit(content=f'```markdown\n> Startup of {server} aborted!\n```')
 
-            def watchDone(future):
-                log.info(f'WD: Ending watch on {server}.')
-                if future.exception():
-                    log.warning(f'WD: Exception in watchdog for {server}!')
-                    raise future.exception()
-                asyncio.run_coroutine_threadsafe(watchGone(), self.loop)
-
-            def watch(event):
-                log.info(f'WD: Starting watch on {server}.')
-                serverProc = getProc(server)
-                if serverProc and serverProc.is_running():
-                    lastState = True
-                else:
-                    lastState = False
-                while not event.is_set():
-                    if lastState:
-                        if not serverProc.is_running():
-                            log.info(f'WD: {server} is gone!')
-                            lastState = False
-                            now = time()
-                            rpath, mtime = getcrashreport(server, self.servercfg['serverspath'])
-                            if mtime > (now - 60):
-                                crashed = True
-                                ctime, desc, strace, flav, lev, bl, ph = parsereport(rpath)
-                                report = formatreport(
-                                    rpath, ctime, desc, flav, strace, lev, bl, ph
-                                )
-                                coro = serverGone(crashed, report)
-                            else:
-                                crashed = False
-                                coro = serverGone(crashed)
-                            asyncio.run_coroutine_threadsafe(coro, self.loop)
-                            if crashed:
-                                asyncio.run_coroutine_threadsafe(startServer(), self.loop)
-                            event.wait(timeout=30)
-                        event.wait(timeout=20)
-                    else:
-                        serverProc = getProc(server)
-                        if serverProc and serverProc.is_running():
-                            log.info(f'WD: {server} is back online!')
-                            lastState = True
-                            asyncio.run_coroutine_threadsafe(serverBack(), self.loop)
-                            event.wait(timeout=20)
-                        else:
-                            event.wait(timeout=30)
+            async def crashed(rpath, now):
+                # The report's path may come from the crash listener, which
+                # never checked it, so fall back to the latest report.
+                try:
+                    report = await self.loop.run_in_executor(None, parsereport, rpath)
+                except Exception as e:
+                    log.warning(f'WD: Could not read {rpath}: {e}, trying the latest report.')
+                    try:
+                        rpath, mtime = await self.loop.run_in_executor(
+                            None, getcrashreport, server, self.servercfg['serverspath']
+                        )
+                        if mtime < (now - 60):
+                            raise OSError('Latest report is too old')
+                        report = await self.loop.run_in_executor(None, parsereport, rpath)
+                    except Exception as e:
+                        log.error(f'WD: No crash report of {server} could be read: {e}')
+                        await serverGone(True, [], 'The crash report could not be read!')
+                        return
+                try:
+                    fp, entry, new = await self.crashprints.record(server, report)
+                except Exception as e:
+                    log.error(f'WD: Recording crash of {server} failed: {e}')
+                    new = True
+                if new:
+                    await serverGone(True, formatreport(report))
                 else:
+                    await serverGone(True, [], summarizeprint(fp, entry))
+
+            async def watch(server, up):
+                if up:
+                    log.info(f'WD: {server} is back online!')
+                    await serverBack()
                     return
+                log.info(f'WD: {server} is gone!')
+                now = time()
+                rpath, mtime = self.crashpaths.pop(server, (None, 0))
+                if mtime < (now - 60):
+                    try:
+                        rpath, mtime = await self.loop.run_in_executor(
+                            None, getcrashreport, server, self.servercfg['serverspath']
+                        )
+                    except (IndexError, OSError):
+                        rpath, mtime = None, 0
+                if mtime > (now - 60):
+                    try:
+                        await crashed(rpath, now)
+                    finally:
+                        await startServer()
+                else:
+                    await serverGone(False)
 
-            event = Event()
-            watchFuture = self.loop.run_in_executor(None, watch, event)
-            watchFuture.add_done_callback(watchDone)
-            self.watchdogs[server] = (watchFuture, event)
+            log.info(f'WD: Starting watch on {server}.')
+            self.supervisor.watch(server, watch)
+            self.watchdogs[server] = ctx
+            if server not in self.crashlisteners or self.crashlisteners[server].done():
+                self.crashlisteners[server] = self.loop.create_task(self._crashlistener(server))
             await ctx.sendmarkdown('# Watchdog activated!', deletable=False)
 
     @watchdog.command(name='activate', aliases=['start', 'watch'])
@@ -207,10 +234,12 @@ class Watchdog(commands.Cog):
     async def wdstop(self, ctx, server: str):
         """Stop the process watchdog for a server."""
 
-        if server in self.watchdogs and not self.watchdogs[server][0].done():
-            watcher = self.watchdogs[server]
-            watcher[1].set()
-            await ctx.sendmarkdown(f'> Terminating {server} watchdog...', deletable=False)
+        if self.supervisor.isWatched(server):
+            log.info(f'WD: Ending watch on {server}.')
+            self.supervisor.unwatch(server)
+            if server in self.crashlisteners:
+                self.crashlisteners.pop(server).cancel()
+            await ctx.sendmarkdown(f'> Ended watch on {server}!', deletable=False)
         else:
             if server not in self.servercfg['servers']:
                 log.warning(f'{server} has been misspelled or not configured!')
@@ -227,5 +256,12 @@ def setup(bot):
         bot.servercfg = Config(f'{bot.dir}/configs/serverCfgs.toml',
                                default=default,
                                load=True, loop=bot.loop)
+    if not hasattr(bot, 'logbus'):
+        bot.logbus = LogBus(bot.servercfg, bot.loop)
+    if not hasattr(bot, 'supervisor'):
+        bot.supervisor = Supervisor(bot.loop)
+    if not hasattr(bot, 'crashprints'):
+        bot.crashprints = CrashPrints(Config(f'{bot.dir}/configs/crashprints.json',
+                                             load=True, loop=bot.loop))
     bot.register_nodes([f'{__name__}.watchdog'])
     bot.add_cog(Watchdog(bot))
@@ -1,5 +1,26 @@
-from .mcservutils import isUp, termProc, getProc, sendCmd, sendCmds, exec_cmd, \
+from .mcservutils import isUp, termProc, getProc, sendCmd, sendCmds, fanoutCmds, exec_cmd, \
     serverStart, serverStop, serverTerminate, serverStatus, buildCountdownSteps, \
-    getcrashreport, parsereport, formatreport
+    getcrashreport
+from .crashreport import CrashReport, parsereport, formatreport
+from .crashprints import CrashPrints, fingerprint, summarizeprint
+from .procregistry import ProcRegistry, serverprocs
+from .console import Console, ScreenTransport, LocalTransport, console
+from .crashindex import CrashIndex, getcrashindex
+from .supervisor import Supervisor
+from .logtail import LogTail, Subscription
+from .logbus import LogBus, LogEvent, parseline
+from .archiveindex import buildindex, loadindex, writeindex, extractmembers, membername
+from .verify import Verifier, Throttle, verifyarchive
+from .backupcatalog import BackupCatalog, getcatalog, parsestamp
+from .retention import gfsplan, prunefiles, collectgarbage, usagetrend
+from .restore import RestoreJob, opendecoder, swapin, removeaside
+from .anvil import readheader, regionspans, diffheaders, splicechunks, \
+    chunkindex, regionname
+from .chunkrestore import groupchunks, restorechunks
+from .area import bboxchunks, polygonchunks, resolvearea
+from .regiondiff import diffregions
+from .snapshots import ChunkStore, Snapshots, snapshot, restoresnapshot
 from .mcuser import getUUID, getUserData, MCUser, mojException
-from .relayutils import MessageType, TypeMapping, RelayConfig
+from .relayformat import convert_to, escape, unescape, clean, clean_emoji
+from .relayutils import MessageType, TypeMapping, RelayConfig, Dispatcher, Packet, Spill, \
+    FRAMED, maxframe, policies, overflow
@@ -0,0 +1,131 @@
+import os
+import re
+import mmap
+import struct
+
+SECTOR = 4096
+HEADER = 2 * SECTOR
+
+regionpat = re.compile(r'^r\.(?P<x>-?\d+)\.(?P<z>-?\d+)\.mca$')
+
+_table = struct.Struct('>1024I')
+_entry = struct.Struct('>I')
+
+
+def chunkindex(cx, cz):
+    """Returns the index of a chunk within its region's header."""
+
+    return (cx & 31) + (cz & 31) * 32
+
+
+def regionname(cx, cz):
+    """Returns the filename of the region file holding a given chunk."""
+
+    return f'r.{cx >> 5}.{cz >> 5}.mca'
+
+
+def readheader(data):
+    """Reads the header of an Anvil region file.
+
+    Takes at least the first 8 KiB of the file and returns two lists of
+    1024 entries each, indexed by 'x + z * 32' of the chunk within the region;
+    The chunk locations as (sector offset, sector count) pairs
+    and the chunk timestamps.
+    """
+
+    if len(data) < HEADER:
+        data = bytes(data) + bytes(HEADER - len(data))
+    locations = [(v >> 8, v & 0xff) for v in _table.unpack_from(data, 0)]
+    timestamps = list(_table.unpack_from(data, SECTOR))
+    return locations, timestamps
+
+
+def regionspans(data):
+    """Splits a region file's contents into the spans that make it up;
+    The header, followed by the sectors of each stored chunk.
+
+    Returns a list of (offset, length) pairs.
+    """
+
+    spans = [(0, min(HEADER, len(data)))]
+    locations, _ = readheader(data[:HEADER])
+    for offset, count in sorted(set(locations)):
+        if offset < 2 or count == 0:
+            continue
+        start = offset * SECTOR
+        if start >= len(data):
+            continue
+        spans.append((start, min(count * SECTOR, len(data) - start)))
+    return spans
+
+
+def diffheaders(old, new):
+    """Compares two region headers, as returned by 'readheader'.
+
+    Returns the indices of all chunks that were added, removed or
+    saved at a different time.
+    """
+
+    oldlocs, oldtimes = old
+    newlocs, newtimes = new
+    return [
+        i for i in range(1024)
+        if bool(oldlocs[i][0]) != bool(newlocs[i][0]) or
+        (newlocs[i][0] and oldtimes[i] != newtimes[i])
+    ]
+
+
+def splicechunks(livepath, backup, chunks):
+    """Replaces the given chunks of a live region file with those
+    from a backup copy of it, given as bytes.
+
+    The live file is memory-mapped and only the header entries and
+    sectors of the given chunks are written; Chunks that fit into their
+    current sectors are written in place, all others are appended.
+    Chunks absent from the backup are removed from the live file.
+    A missing live file is created.
+
+    Returns the number of bytes written.
+    """
+
+    backuplocs, backuptimes = readheader(backup[:HEADER])
+    fd = os.open(livepath, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'r+b') as f:
+        size = os.fstat(fd).st_size
+        if size < HEADER:
+            f.truncate(HEADER)
+            size = HEADER
+        end = -(-size // SECTOR)
+        with mmap.mmap(fd, 0) as mm:
+            livelocs, _ = readheader(mm[:HEADER])
+        # Work out placement first, so the file only needs to grow once.
+        placed = []
+        for i in sorted(set(chunks)):
+            offset, count = backuplocs[i]
+            if not offset or not count:
+                placed.append((i, 0, 0, b''))
+                continue
+            data = backup[offset * SECTOR:(offset + count) * SECTOR]
+            liveoffset, livecount = livelocs[i]
+            if liveoffset >= 2 and count <= livecount:
+                target = liveoffset
+            else:
+                target = end
+                end += count
+            placed.append((i, target, count, data))
+        if end * SECTOR > size:
+            f.truncate(end * SECTOR)
+        written = 0
+        with mmap.mmap(fd, 0) as mm:
+            for i, target, count, data in placed:
+                if count:
+                    start = target * SECTOR
+                    mm[start:start + len(data)] = data
+                    padding = count * SECTOR - len(data)
+                    if padding:
+                        mm[start + len(data):start + count * SECTOR] = bytes(padding)
+                    written += count * SECTOR
+                _entry.pack_into(mm, i * 4, (target << 8) | count)
+                _entry.pack_into(mm, SECTOR + i * 4, backuptimes[i] if count else 0)
+            mm.flush()
+    return written
@@ -0,0 +1,120 @@
+import os
+import json
+import gzip
+import shutil
+import tarfile
+import logging
+
+log = logging.getLogger('charfred')
+
+
+def indexpath(archive):
+    return archive + '.idx'
+
+
+def membername(name):
+    """Returns an archive member's name without a leading './'."""
+
+    return name[2:] if name.startswith('./') else name
+
+
+def buildindex(archive):
+    """Builds the member index sidecar for a given .tar.gz archive.
+
+    The index maps every regular file in the archive to its offset and size
+    within the decompressed tar stream, along with its mode and mtime;
+    Member names are stored without a leading './'.
+    """
+
+    log.info(f'AI: Indexing {archive}...')
+    st = os.stat(archive)
+    members = {}
+    with gzip.open(archive, 'rb') as gz:
+        with tarfile.open(fileobj=gz, mode='r|') as tf:
+            for info in tf:
+                if info.isfile():
+                    members[membername(info.name)] = [info.offset_data, info.size, info.mode, info.mtime]
+    return writeindex(archive, members, st)
+
+
+def writeindex(archive, members, st=None):
+    """Writes the member index sidecar for a given archive."""
+
+    st = st or os.stat(archive)
+    index = {
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'members': members
+    }
+    tmp = indexpath(archive) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, indexpath(archive))
+    log.info(f'AI: Indexed {len(members)} members of {archive}.')
+    return index
+
+
+def loadindex(archive, build=True):
+    """Returns the member index for a given archive,
+    building it first if it is missing or outdated.
+
+    If 'build' is False, returns None instead of building it.
+    """
+
+    st = os.stat(archive)
+    try:
+        with open(indexpath(archive), 'r') as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        index = None
+    if index and index.get('size') == st.st_size and index.get('mtime') == st.st_mtime:
+        # Indexes written before names were normalized may still hold './'.
+        index['members'] = {membername(n): m for n, m in index['members'].items()}
+        return index
+    return buildindex(archive) if build else None
+
+
+def extractmembers(archive, names, dest):
+    """Extracts the given members of an archive to dest, in a single
+    forward pass over the archive, seeking from member to member.
+
+    Returns the list of names that were not found in the archive.
+    """
+
+    members = loadindex(archive)['members']
+    missing = [n for n in names if n not in members]
+    wanted = sorted((n for n in set(names) if n in members), key=lambda n: members[n][0])
+    dest = os.path.abspath(dest)
+    with gzip.open(archive, 'rb') as gz:
+        for name in wanted:
+            offset, size, mode, mtime = members[name]
+            target = os.path.abspath(os.path.join(dest, name))
+            if not target.startswith(dest + os.sep):
+                log.warning(f'AI: Refusing to extract {name} outside of {dest}!')
+                missing.append(name)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            gz.seek(offset)
+            with open(target, 'wb') as out:
+                shutil.copyfileobj(_Limited(gz, size), out)
+            os.chmod(target, mode)
+            os.utime(target, (mtime, mtime))
+            log.info(f'AI: Extracted {name}.')
+    return missing
+
+
+class _Limited:
+    """File-like reading at most 'size' bytes from another file."""
+
+    def __init__(self, f, size):
+        self.f = f
+        self.left = size
+
+    def read(self, n=-1):
+        if self.left <= 0:
+            return b''
+        if n < 0 or n > self.left:
+            n = self.left
+        data = self.f.read(n)
+        self.left -= len(data)
+        return data
@@ -0,0 +1,85 @@
+import math
+from .anvil import chunkindex, regionname
+
+
+def bboxchunks(x1, z1, x2, z2):
+    """Returns the coordinates of all chunks within a bounding box
+    of block coordinates, both corners inclusive.
+    """
+
+    x1, x2 = sorted((x1, x2))
+    z1, z2 = sorted((z1, z2))
+    return {(cx, cz) for cx in range(x1 >> 4, (x2 >> 4) + 1)
+            for cz in range(z1 >> 4, (z2 >> 4) + 1)}
+
+
+def _xrange(a, b, lo, hi):
+    """Returns the x-range of the segment a-b within lo <= z <= hi, or None."""
+
+    (ax, az), (bx, bz) = sorted((a, b), key=lambda p: p[1])
+    if bz < lo or az > hi:
+        return None
+    if az == bz:
+        return min(ax, bx), max(ax, bx)
+
+    def xat(z):
+        return ax + (bx - ax) * (z - az) / (bz - az)
+
+    xs = (xat(max(az, lo)), xat(min(bz, hi)))
+    return min(xs), max(xs)
+
+
+def polygonchunks(points):
+    """Returns the coordinates of all chunks touched by a polygon,
+    given as a list of (x, z) block coordinates.
+
+    Works one row of chunks at a time; All chunks a polygon edge passes
+    through are found from the edge's x-range within the row, while
+    chunks entirely inside are found by scanning across the row's middle.
+    """
+
+    edges = list(zip(points, points[1:] + points[:1]))
+    zs = [z for _, z in points]
+    chunks = set()
+    for cz in range(math.floor(min(zs)) >> 4, (math.floor(max(zs)) >> 4) + 1):
+        lo, hi = cz * 16, cz * 16 + 16
+        for a, b in edges:
+            xr = _xrange(a, b, lo, hi)
+            if xr:
+                chunks.update((cx, cz) for cx in range(math.floor(xr[0]) >> 4,
+                                                       (math.floor(xr[1]) >> 4) + 1))
+        mid = lo + 8
+        crossings = sorted(
+            ax + (bx - ax) * (mid - az) / (bz - az)
+            for (ax, az), (bx, bz) in edges
+            if (az <= mid < bz) or (bz <= mid < az)
+        )
+        for xa, xb in zip(crossings[::2], crossings[1::2]):
+            chunks.update((cx, cz) for cx in range(math.ceil((xa - 8) / 16),
+                                                   math.floor((xb - 8) / 16) + 1))
+    return chunks
+
+
+def resolvearea(coords):
+    """Resolves an area of block coordinates into the regions and
+    chunks it covers.
+
+    Takes a flat list of coordinates, either the x, z of two corners
+    of a bounding box, or the x, z of three or more polygon corners.
+
+    Returns a dict mapping region filenames to sorted chunk indices.
+    Raises ValueError if the coordinates do not describe an area.
+    """
+
+    if len(coords) == 4:
+        chunks = bboxchunks(*coords)
+    elif len(coords) >= 6 and len(coords) % 2 == 0:
+        chunks = polygonchunks(list(zip(coords[::2], coords[1::2])))
+    else:
+        raise ValueError('An area needs two corners of a box, or three or more corners of a polygon!')
+    regions = {}
+    for cx, cz in sorted(chunks):
+        regions.setdefault(regionname(cx, cz), []).append(chunkindex(cx, cz))
+    for indices in regions.values():
+        indices.sort()
+    return regions
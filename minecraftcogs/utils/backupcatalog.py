@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import logging
+import threading
+from time import mktime
+
+log = logging.getLogger('charfred')
+
+stamppat = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})[_T-]?(\d{2})[-:.]?(\d{2})(?:[-:.]?(\d{2}))?')
+
+
+def parsestamp(name, default):
+    """Returns the timestamp contained in a backup's name, or default."""
+
+    match = stamppat.search(name)
+    if not match:
+        return default
+    parts = [int(p) if p else 0 for p in match.groups()]
+    try:
+        return mktime((*parts, 0, 0, -1))
+    except (OverflowError, ValueError):
+        return default
+
+
+class BackupCatalog:
+    """Catalog of the backup archives of a single server,
+    persisted as '.catalog.json' in its backup directory.
+
+    The directory is only listed again once its own mtime changed,
+    while archives that are not yet fully cataloged get stat'ed on
+    every refresh, as they may still be written to. Member count, worlds and checksum are expensive to
+    get, so they are filled in by verification, see 'record'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.catpath = os.path.join(path, '.catalog.json')
+        self.dirmtime = None
+        self.lock = threading.RLock()
+        try:
+            with open(self.catpath, 'r') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+        self.dirty = False
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = self.catpath + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.catpath)
+            self.dirty = False
+
+    def _update(self, name, st):
+        """Catalogs an archive anew, unless its size and mtime are unchanged."""
+
+        entry = self.entries.get(name)
+        if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+            return
+        self.entries[name] = {
+            'size': st.st_size, 'mtime': st.st_mtime,
+            'timestamp': parsestamp(name, st.st_mtime),
+            'members': None, 'worlds': None, 'checksum': None,
+            'verified': None, 'error': None
+        }
+        self.dirty = True
+
+    def refresh(self):
+        with self.lock:
+            try:
+                dirmtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                self.dirmtime = None
+                return
+            if dirmtime == self.dirmtime:
+                # An archive still being written does not change the
+                # directory's mtime, so anything unverified is stat'ed again.
+                for name, entry in list(self.entries.items()):
+                    if entry['checksum']:
+                        continue
+                    try:
+                        self._update(name, os.stat(os.path.join(self.path, name)))
+                    except FileNotFoundError:
+                        continue
+            else:
+                seen = set()
+                with os.scandir(self.path) as dirents:
+                    for dirent in dirents:
+                        if not dirent.name.endswith('.tar.gz') or not dirent.is_file():
+                            continue
+                        seen.add(dirent.name)
+                        # Verified archives are compared too, one replaced
+                        # in place has to lose its checksum and result.
+                        self._update(dirent.name, dirent.stat())
+                for name in self.entries.keys() - seen:
+                    del self.entries[name]
+                    self.dirty = True
+                self.dirmtime = dirmtime
+                log.debug(f'BC: {self.path} cataloged, {len(self.entries)} backups.')
+        self.save()
+
+    def record(self, name, result):
+        """Records the result of verifying a given archive,
+        as returned by 'verifyarchive'.
+
+        An archive whose checksum changed since it was first cataloged
+        is recorded as corrupted.
+        """
+
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return
+            if result['error'] is None:
+                if entry['checksum'] and entry['checksum'] != result['checksum']:
+                    result['error'] = 'Checksum changed since the archive was cataloged!'
+                else:
+                    index = result['index']
+                    entry['members'] = len(index)
+                    entry['worlds'] = sorted({m.split('/', 1)[0] for m in index if '/region/' in m})
+                    entry['checksum'] = result['checksum']
+            entry['verified'] = result['verified']
+            entry['error'] = result['error']
+            self.dirty = True
+
+    def query(self, prefix=None, since=None, until=None, reverse=False, offset=0, limit=None):
+        """Returns (name, entry) pairs sorted by timestamp,
+        optionally only those whose name starts with prefix and
+        whose timestamp falls between since and until.
+        """
+
+        self.refresh()
+        with self.lock:
+            matches = [
+                (name, entry) for name, entry in self.entries.items()
+                if (prefix is None or name.startswith(prefix)) and
+                (since is None or entry['timestamp'] >= since) and
+                (until is None or entry['timestamp'] <= until)
+            ]
+        matches.sort(key=lambda m: (m[1]['timestamp'], m[0]), reverse=reverse)
+        if limit is None:
+            return matches[offset:]
+        return matches[offset:offset + limit]
+
+    def match(self, part):
+        """Returns the path of the archive a given name part refers to.
+
+        An exact name always wins, otherwise the part must be found in
+        exactly one name; Returns None if that is not the case.
+        """
+
+        self.refresh()
+        with self.lock:
+            if part in self.entries:
+                return os.path.join(self.path, part)
+            matches = [name for name in self.entries if part in name]
+        if len(matches) != 1:
+            return None
+        return os.path.join(self.path, matches[0])
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_catalogs = {}
+
+
+def getcatalog(server, backupspath):
+    """Returns the BackupCatalog for a given server."""
+
+    path = backupspath + f'/{server}'
+    if path not in _catalogs:
+        _catalogs[path] = BackupCatalog(path)
+    return _catalogs[path]
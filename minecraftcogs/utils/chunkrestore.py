@@ -0,0 +1,51 @@
+import os
+import mmap
+import shutil
+import tempfile
+import logging
+from .anvil import chunkindex, regionname, splicechunks
+from .archiveindex import extractmembers
+
+log = logging.getLogger('charfred')
+
+
+def groupchunks(coords):
+    """Groups chunk coordinates by region file.
+
+    Returns a dict mapping region filenames to lists of chunk indices.
+    """
+
+    regions = {}
+    for cx, cz in coords:
+        regions.setdefault(regionname(cx, cz), []).append(chunkindex(cx, cz))
+    return regions
+
+
+def restorechunks(archive, serverdir, world, regions):
+    """Restores the given chunks of a world from a backup archive.
+
+    'regions' maps region filenames to lists of chunk indices, as
+    returned by 'groupchunks'. Only the affected region files are
+    extracted, into a temporary directory, and their chunks spliced
+    into the live region files.
+
+    Returns the regions missing from the backup and the number of bytes
+    written to the live region files.
+    """
+
+    regiondir = os.path.join(serverdir, world, 'region')
+    names = [f'{world}/region/{r}' for r in regions]
+    tmp = tempfile.mkdtemp(prefix='.chunks-', dir=serverdir)
+    try:
+        missing = extractmembers(archive, names, tmp)
+        written = 0
+        for region, chunks in regions.items():
+            if f'{world}/region/{region}' in missing:
+                continue
+            with open(os.path.join(tmp, world, 'region', region), 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as backup:
+                    written += splicechunks(os.path.join(regiondir, region), backup, chunks)
+            log.info(f'CR: Restored {len(chunks)} chunks of {region}.')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return [m.rsplit('/', 1)[1] for m in missing], written
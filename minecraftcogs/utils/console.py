@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+log = logging.getLogger('charfred')
+
+
+class ScreenTransport:
+    """Writes console lines to a server by stuffing them into its screen session.
+
+    All lines of one batch are passed to a single screen invocation.
+    """
+
+    maxpayload = 512
+
+    async def write(self, server, cmds):
+        payload = ''.join(f'{cmd}\r' for cmd in cmds)
+        proc = await asyncio.create_subprocess_exec(
+            'screen', '-S', server, '-X', 'stuff', payload
+        )
+        await proc.wait()
+        return proc.returncode == 0
+
+
+class LocalTransport:
+    """Stand-in transport that records written lines instead of
+    passing them to a server, for testing without screen.
+    """
+
+    maxpayload = 512
+
+    def __init__(self):
+        self.written = defaultdict(list)
+        self.writes = 0
+
+    async def write(self, server, cmds):
+        self.written[server].extend(cmds)
+        self.writes += 1
+        return True
+
+
+class Console:
+    """Per-server console writers on top of a pluggable transport.
+
+    Each server gets one long-lived writer task, which drains everything
+    queued for that server and hands it to the transport in as few
+    writes as possible, keeping lines in the order they were queued.
+    Writers exit after being idle for a while and are restarted on demand.
+    """
+
+    def __init__(self, transport=None, idle=300):
+        self.transport = transport or ScreenTransport()
+        self.idle = idle
+        self.queues = {}
+        self.writers = {}
+
+    async def send(self, server, cmd):
+        return await self.send_many(server, [cmd])
+
+    async def send_many(self, server, cmds):
+        """Queues the given lines for a server and waits until they were written.
+
+        Returns a boolean indicating whether all lines were written successfully.
+        """
+
+        cmds = list(cmds)
+        if not cmds:
+            return True
+        loop = asyncio.get_event_loop()
+        done = loop.create_future()
+        if server not in self.queues:
+            self.queues[server] = asyncio.Queue()
+        self.queues[server].put_nowait((cmds, done))
+        if server not in self.writers:
+            self.writers[server] = loop.create_task(self._writer(server))
+        return await done
+
+    def _batches(self, cmds):
+        batch = []
+        size = 0
+        for cmd in cmds:
+            if batch and (size + len(cmd) + 1) > self.transport.maxpayload:
+                yield batch
+                batch = []
+                size = 0
+            batch.append(cmd)
+            size += len(cmd) + 1
+        if batch:
+            yield batch
+
+    async def _writer(self, server):
+        queue = self.queues[server]
+        try:
+            while True:
+                try:
+                    pending = [await asyncio.wait_for(queue.get(), self.idle)]
+                except asyncio.TimeoutError:
+                    # Lines may have been queued just as the wait timed out.
+                    if queue.empty():
+                        break
+                    pending = [queue.get_nowait()]
+                while not queue.empty():
+                    pending.append(queue.get_nowait())
+                # Senders that gave up waiting, e.g. on a timeout, are told their
+                # lines were not sent, so they must not be sent after all.
+                pending = [(chunk, done) for chunk, done in pending if not done.cancelled()]
+                if not pending:
+                    continue
+
+                cmds = [cmd for chunk, _ in pending for cmd in chunk]
+                try:
+                    ok = True
+                    for batch in self._batches(cmds):
+                        ok = await self.transport.write(server, batch) and ok
+                except Exception as e:
+                    log.error(f'Console: Writing to {server} failed: {e}')
+                    for _, done in pending:
+                        if not done.done():
+                            done.set_exception(e)
+                else:
+                    if not ok:
+                        log.warning(f'Console: {server} did not accept all commands!')
+                    for _, done in pending:
+                        if not done.done():
+                            done.set_result(ok)
+        finally:
+            del self.writers[server]
+
+
+console = Console()
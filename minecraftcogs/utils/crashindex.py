@@ -0,0 +1,80 @@
+import os
+import logging
+import threading
+from bisect import insort
+
+log = logging.getLogger('charfred')
+
+
+class CrashIndex:
+    """Crashreports of a single server, kept sorted by modification time.
+
+    The directory is only listed again once its own mtime changed,
+    and then only reports that are new to the index get stat'ed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dirmtime = None
+        self.reports = []
+        self.mtimes = {}
+        self.lock = threading.Lock()
+
+    def update(self):
+        try:
+            dirmtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self.dirmtime = None
+            self.reports = []
+            self.mtimes = {}
+            return
+        if dirmtime == self.dirmtime:
+            return
+
+        seen = set()
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                seen.add(entry.path)
+                if entry.path in self.mtimes:
+                    continue
+                mtime = entry.stat().st_mtime
+                self.mtimes[entry.path] = mtime
+                insort(self.reports, (mtime, entry.path))
+        gone = self.mtimes.keys() - seen
+        if gone:
+            for rpath in gone:
+                del self.mtimes[rpath]
+            self.reports = [r for r in self.reports if r[1] not in gone]
+        self.dirmtime = dirmtime
+        log.debug(f'CI: {self.path} indexed, {len(self.reports)} reports.')
+
+    def nthlast(self, nthlast=0):
+        """Returns path and mtime of the nth latest report.
+
+        Raises IndexError if there is no such report.
+        """
+
+        with self.lock:
+            self.update()
+            mtime, rpath = self.reports[-1 - nthlast]
+        return rpath, mtime
+
+    def newest(self):
+        return self.nthlast(0)
+
+    def __len__(self):
+        return len(self.reports)
+
+
+_indices = {}
+
+
+def getcrashindex(server, serverspath):
+    """Returns the CrashIndex for a given server."""
+
+    path = serverspath + f'/{server}/crash-reports'
+    if path not in _indices:
+        _indices[path] = CrashIndex(path)
+    return _indices[path]
@@ -0,0 +1,102 @@
+import re
+import hashlib
+import logging
+from time import time, strftime, localtime
+
+log = logging.getLogger('charfred')
+
+linenumpat = re.compile(r'(\([^()\s:]+):\d+\)')
+jarpat = re.compile(r'\s*~?\[[^\]]*\]\s*$')
+lambdapat = re.compile(r'\$\d+')
+addrpat = re.compile(r'(@[0-9a-f]{4,}|0x[0-9a-f]+)', flags=re.I)
+
+
+def normalize(strace):
+    """Strips everything from a short stacktrace that differs between
+    occurences of the same crash, such as line numbers, jar annotations,
+    generated lambda names, addresses and the exception message.
+    """
+
+    lines = []
+    for i, l in enumerate(strace):
+        l = l.strip()
+        if not l:
+            continue
+        if i == 0:
+            l = l.split(':', 1)[0]
+        else:
+            l = linenumpat.sub(r'\1)', l)
+            l = jarpat.sub('', l)
+            l = lambdapat.sub('$', l)
+        lines.append(addrpat.sub('', l))
+    return lines
+
+
+def fingerprint(report):
+    """Returns a short hash identifying the crash a CrashReport describes,
+    or None if its stacktrace is empty or could not be parsed, as all such
+    crashes would otherwise share the same fingerprint.
+    """
+
+    normalized = '\n'.join(normalize(report.strace))
+    if not normalized:
+        return None
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class CrashPrints:
+    """Index of known crash fingerprints, kept in a given Config.
+
+    Per fingerprint it holds when it was first and last seen, how often
+    it was seen in total and per server, and the last report per server,
+    so that the same report is never counted twice.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+    def lookup(self, report):
+        """Returns fingerprint and index entry for a given CrashReport,
+        entry being None for unknown crashes, and crashes without fingerprint.
+        """
+
+        fp = fingerprint(report)
+        if fp is None:
+            return None, None
+        return fp, self.cfg[fp] if fp in self.cfg else None
+
+    async def record(self, server, report):
+        """Records an occurence of a crash on a given server.
+
+        Returns fingerprint, index entry and whether the crash is new;
+        Crashes without fingerprint are not recorded and always new.
+        """
+
+        fp, entry = self.lookup(report)
+        if fp is None:
+            log.info(f'CP: Crash on {server} has no usable stacktrace, not recorded.')
+            return None, None, True
+        new = entry is None
+        if new:
+            entry = {
+                'first': time(), 'last': 0, 'count': 0,
+                'description': report.description.strip(), 'servers': {}
+            }
+        seen = entry['servers'].get(server, [0, None])
+        if seen[1] == report.rpath:
+            return fp, entry, False
+        entry['servers'][server] = [seen[0] + 1, report.rpath]
+        entry['count'] += 1
+        entry['last'] = time()
+        self.cfg[fp] = entry
+        await self.cfg.save()
+        log.info(f'CP: Recorded {fp} on {server}, seen {entry["count"]} times.')
+        return fp, entry, new
+
+
+def summarizeprint(fp, entry):
+    """Returns a one line summary of a crash fingerprint's history."""
+
+    first = strftime('%Y-%m-%d %H:%M', localtime(entry['first']))
+    return (f'Crash {fp} seen {entry["count"]} times on '
+            f'{len(entry["servers"])} servers since {first}')
@@ -0,0 +1,143 @@
+import os
+import logging
+import functools
+
+log = logging.getLogger('charfred')
+
+
+class CrashReport:
+    """A parsed crashreport.
+
+    'sections' holds every '-- Name --' section of the report as a
+    (name, lines) pair, in order, including their Details and
+    Stacktrace parts.
+    """
+
+    __slots__ = ('rpath', 'flavor', 'time', 'description', 'strace', 'sections')
+
+    def __init__(self, rpath):
+        self.rpath = rpath
+        self.flavor = ''
+        self.time = ''
+        self.description = ''
+        self.strace = []
+        self.sections = []
+
+    def section(self, prefix):
+        """Returns the lines of all sections whose name starts with a given prefix."""
+
+        return [lines for name, lines in self.sections if name.startswith(prefix)]
+
+    @property
+    def level(self):
+        level = []
+        for lines in self.section('Affected'):
+            level.append('# Affected level:\n')
+            level.extend(lines)
+        return level
+
+    @property
+    def block(self):
+        block = []
+        for lines in self.section('Block'):
+            block.append('# Block entity being ticked:\n')
+            for l in lines:
+                if l == 'Stacktrace:\n':
+                    break
+                block.append(l)
+        return block
+
+    @property
+    def phase(self):
+        for lines in self.section('Sponge'):
+            phase = ['# Sponge PhaseTracker:\n']
+            # Skips the first two lines and works around the PhaseTracker flipping out.
+            for l in lines[2:22]:
+                if l.startswith('/***') or l.startswith('Stacktrace:'):
+                    break
+                phase.append(l)
+            if len(phase) > 1:
+                return phase
+        return []
+
+
+def _parse(rpath):
+    report = CrashReport(rpath)
+    with open(rpath, 'r') as r:
+        lines = iter(r)
+        # Discard until flavortext is found.
+        for l in lines:
+            if l.startswith('// '):
+                report.flavor = l
+                break
+        # Time and Description lines follow after a blank line.
+        next(lines, '')
+        report.time = next(lines, '')
+        report.description = next(lines, '')
+        next(lines, '')
+        for l in lines:
+            if l == '\n':
+                break
+            report.strace.append(l)
+        # Collect all sections of the remaining report.
+        section = None
+        for l in lines:
+            if l.startswith('-- '):
+                section = []
+                report.sections.append((l.strip('- \n'), section))
+            elif section is not None:
+                if l == '\n':
+                    section = None
+                else:
+                    section.append(l)
+    return report
+
+
+@functools.lru_cache(maxsize=32)
+def _parsecached(rpath, mtime, size):
+    log.debug(f'Parsing {rpath}.')
+    return _parse(rpath)
+
+
+def parsereport(rpath):
+    """Retrieves and parses a crashreport given its path.
+
+    Parsed reports are cached, as long as the file is unchanged.
+    """
+
+    st = os.stat(rpath)
+    return _parsecached(rpath, st.st_mtime_ns, st.st_size)
+
+
+def formatreport(report):
+    """Format a given CrashReport into discord messegable chunks."""
+
+    out = []
+    out.append('> ' + os.path.basename(report.rpath) + '\n')
+    out.append('# ' + report.flavor + '\n')
+    out.append('# ' + report.time)
+    out.append('# ' + report.description + '\n')
+    out.append('# Shortened Stacktrace:\n')
+    out.extend(report.strace[:4])
+    out = ''.join(out)
+
+    chunks = [out]
+
+    chunk = ''
+    for s in (report.level, report.block, report.phase):
+        siter = iter(s)
+        while len(chunk) < 2000:
+            try:
+                l = next(siter)
+            except StopIteration:
+                break
+            if (len(l) + len(chunk)) < 2000:
+                chunk += l
+            else:
+                chunks.append(chunk)
+                chunk = l
+    else:
+        if chunk:
+            chunks.append(chunk)
+
+    return chunks
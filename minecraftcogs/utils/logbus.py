@@ -0,0 +1,95 @@
+import re
+import logging
+import functools
+from collections import namedtuple
+from .logtail import LogTail
+
+log = logging.getLogger('charfred')
+
+LogEvent = namedtuple('LogEvent', [
+    'server', 'timestamp', 'thread', 'level', 'message', 'line'
+])
+
+# [12:34:56] [Server thread/INFO] [minecraft/DedicatedServer]: Done
+linepat = re.compile(
+    r'^\[(?P<timestamp>[^\]]+)\] \[(?P<thread>[^\]]*)/(?P<level>[A-Z]+)\]'
+    r'(?: \[[^\]]*\])?: (?P<message>.*)$'
+)
+# [12:34:56 INFO]: Done
+shortlinepat = re.compile(
+    r'^\[(?P<timestamp>\d\d:\d\d:\d\d) (?P<level>[A-Z]+)\]: (?P<message>.*)$'
+)
+
+levels = {'TRACE': 0, 'DEBUG': 1, 'INFO': 2, 'WARN': 3, 'ERROR': 4, 'FATAL': 5}
+
+
+def parseline(server, line):
+    """Parses a log line into a LogEvent.
+
+    Lines not in a known log format, such as stacktrace lines,
+    become events without timestamp, thread and level.
+    """
+
+    if not line:
+        return None
+    match = linepat.match(line)
+    if match:
+        return LogEvent(server, match.group('timestamp'), match.group('thread'),
+                        match.group('level'), match.group('message'), line)
+    match = shortlinepat.match(line)
+    if match:
+        return LogEvent(server, match.group('timestamp'), None,
+                        match.group('level'), match.group('message'), line)
+    return LogEvent(server, None, None, None, line, line)
+
+
+def _check(pattern, level, event):
+    if level is not None and levels.get(event.level, -1) < level:
+        return False
+    if pattern is not None and not pattern.search(event.message):
+        return False
+    return True
+
+
+class LogBus:
+    """Shared, parsed server logs.
+
+    Every server's latest.log is read by a single LogTail, no matter how
+    many subscribers there are; subscribers each get a bounded queue of
+    LogEvents, filtered by a regex on the message and/or a minimum level.
+    """
+
+    def __init__(self, servercfg, loop):
+        self.servercfg = servercfg
+        self.loop = loop
+        self.tails = {}
+
+    def logpath(self, server):
+        return self.servercfg['serverspath'] + f'/{server}/logs/latest.log'
+
+    def tail(self, server):
+        path = self.logpath(server)
+        tail = self.tails.get(server)
+        if tail is None or tail.path != path:
+            tail = LogTail(path, self.loop, parser=functools.partial(parseline, server))
+            self.tails[server] = tail
+        return tail
+
+    def subscribe(self, server, pattern=None, level=None, maxsize=256):
+        """Subscribes to the log of a given server.
+
+        'pattern' may be a regex string or compiled pattern, matched
+        against the message of each event, 'level' the name of the
+        lowest log level to pass on.
+        """
+
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+        if level is not None:
+            level = levels[level.upper()]
+        if pattern is None and level is None:
+            check = None
+        else:
+            check = functools.partial(_check, pattern, level)
+        log.debug(f'LB: New subscription to {server}.')
+        return self.tail(server).subscribe(maxsize=maxsize, check=check)
@@ -0,0 +1,282 @@
+import os
+import struct
+import asyncio
+import logging
+import ctypes
+import ctypes.util
+
+log = logging.getLogger('charfred')
+
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVED_FROM = 0x00000040
+
+_eventhead = struct.Struct('iIII')
+
+
+def _getlibc():
+    name = ctypes.util.find_library('c')
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    return libc
+
+
+class Inotify:
+    """Minimal inotify binding, watching a single directory
+    for changes to one file within it.
+
+    Raises OSError if inotify is unavailable.
+    """
+
+    libc = None
+
+    def __init__(self, path):
+        if Inotify.libc is None:
+            Inotify.libc = _getlibc()
+        if not Inotify.libc:
+            raise OSError('inotify is unavailable')
+        self.dirname, self.filename = os.path.split(path)
+        self.filename = os.fsencode(self.filename)
+        self.fd = Inotify.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = IN_MODIFY | IN_CREATE | IN_DELETE | IN_MOVED_TO | IN_MOVED_FROM
+        wd = Inotify.libc.inotify_add_watch(self.fd, os.fsencode(self.dirname), mask)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f'Could not watch {self.dirname}')
+
+    def drain(self):
+        """Reads all pending events, returns True if any concerned the watched file."""
+
+        relevant = False
+        while True:
+            try:
+                buf = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            offset = 0
+            while offset + _eventhead.size <= len(buf):
+                _, _, _, namelen = _eventhead.unpack_from(buf, offset)
+                offset += _eventhead.size
+                name = buf[offset:offset + namelen].rstrip(b'\0')
+                offset += namelen
+                if name == self.filename:
+                    relevant = True
+        return relevant
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Subscription:
+    """Bounded queue of lines handed out to one subscriber of a LogTail.
+
+    A subscriber that falls behind never stalls the tail; once its queue
+    is full the oldest lines are dropped and counted instead.
+    """
+
+    def __init__(self, tail, maxsize=256, check=None):
+        self.tail = tail
+        self.check = check
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, item):
+        if self.check and not self.check(item):
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def get(self):
+        """Returns the next item, or None once the subscription was closed."""
+
+        if self.closed and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.tail.unsubscribe(self)
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class FileFollower:
+    """Reads lines appended to a file, following it across
+    rotation and truncation.
+    """
+
+    readsize = 65536
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.inode = None
+        self.partial = b''
+
+    def open(self, fromstart):
+        self.close()
+        self.partial = b''
+        try:
+            self.file = open(self.path, 'rb')
+        except FileNotFoundError:
+            self.inode = None
+            return
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        if not fromstart:
+            self.file.seek(0, 2)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def read(self):
+        """Reads whatever is available, returns a list of complete lines,
+        and whether there may be more to read right away.
+        """
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        rest = b''
+        if st and (self.file is None or st.st_ino != self.inode):
+            log.debug(f'LT: {self.path} was rotated, reopening.')
+            if self.file:
+                rest = self.partial + self.file.read()
+                if rest and not rest.endswith(b'\n'):
+                    rest += b'\n'
+            self.open(fromstart=True)
+        elif st and st.st_size < self.file.tell():
+            log.debug(f'LT: {self.path} was truncated, reading from start.')
+            self.file.seek(0)
+            self.partial = b''
+        if self.file is None:
+            return self._split(rest), False
+
+        data = self.file.read(self.readsize)
+        more = len(data) >= self.readsize
+        if not data and not rest:
+            return [], False
+        return self._split(rest + self.partial + data), more
+
+    def _split(self, data):
+        *lines, self.partial = data.split(b'\n')
+        return [l.decode(errors='replace').rstrip('\r') for l in lines]
+
+
+class LogTail:
+    """Follows a log file on the event loop and passes every new line
+    to all of its subscribers.
+
+    Changes are picked up through inotify where available, otherwise the
+    file is polled with a delay that backs off while nothing is written.
+    The tail only runs while it has subscribers.
+    """
+
+    mindelay = 0.1
+    maxdelay = 2.0
+
+    def __init__(self, path, loop, parser=None):
+        self.path = path
+        self.loop = loop
+        self.parser = parser
+        self.subscribers = set()
+        self.task = None
+
+    def subscribe(self, maxsize=256, check=None):
+        sub = Subscription(self, maxsize=maxsize, check=check)
+        self.subscribers.add(sub)
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+        if not self.subscribers and self.task:
+            self.task.cancel()
+            self.task = None
+
+    def _publish(self, lines):
+        for line in lines:
+            item = self.parser(line) if self.parser else line
+            if item is None:
+                continue
+            for sub in list(self.subscribers):
+                sub.push(item)
+
+    async def _run(self):
+        follower = FileFollower(self.path)
+        follower.open(fromstart=False)
+        wake = asyncio.Event()
+        try:
+            notifier = Inotify(self.path)
+        except OSError as e:
+            log.debug(f'LT: Polling {self.path}, {e}.')
+            notifier = None
+        else:
+            def _wake():
+                if notifier.drain():
+                    wake.set()
+            self.loop.add_reader(notifier.fd, _wake)
+
+        delay = self.mindelay
+        try:
+            while True:
+                lines, more = follower.read()
+                if lines:
+                    self._publish(lines)
+                    delay = self.mindelay
+                if more:
+                    await asyncio.sleep(0)
+                    continue
+                if notifier:
+                    try:
+                        await asyncio.wait_for(wake.wait(), self.maxdelay * 5)
+                    except asyncio.TimeoutError:
+                        pass
+                    wake.clear()
+                else:
+                    await asyncio.sleep(delay)
+                    if not lines:
+                        delay = min(delay * 2, self.maxdelay)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f'LT: Tail on {self.path} failed: {e}')
+            self.task = None
+            for sub in list(self.subscribers):
+                sub.close()
+        finally:
+            if notifier:
+                self.loop.remove_reader(notifier.fd)
+                notifier.close()
+            follower.close()
+
@@ -3,21 +3,20 @@ import asyncio
 import logging
 import os
 import re
-import glob
 import functools
+from .procregistry import serverprocs
+from .console import console
+from .crashindex import getcrashindex
 
 log = logging.getLogger('charfred')
 
 
 def isUp(server):
-    """Checks whether a server is up, by searching for its process.
+    """Checks whether a server is up, by looking up its process.
 
     Returns a boolean indicating whether the server is up or not.
     """
-    for process in psutil.process_iter(attrs=['cmdline']):
-        if f'{server}.jar' in process.info['cmdline']:
-            return True
-    return False
+    return serverprocs.get(server) is not None
 
 
 def termProc(server):
@@ -25,53 +24,74 @@ def termProc(server):
 
     Returns a boolean indicating whether the process was terminated.
     """
-    for process in psutil.process_iter(attrs=['cmdline']):
-        if f'{server}.jar' in process.info['cmdline']:
-            toKill = process.children()
-            toKill.append(process)
-            for p in toKill:
-                p.terminate()
-            gone, alive = psutil.wait_procs(toKill, timeout=3)
-            for p in alive:
-                p.kill()
-            gone, alive = psutil.wait_procs(toKill, timeout=3)
-            if not alive:
-                return True
-            else:
-                return False
-    return False
+    process = serverprocs.get(server)
+    if process is None:
+        return False
+    toKill = process.children()
+    toKill.append(process)
+    for p in toKill:
+        p.terminate()
+    gone, alive = psutil.wait_procs(toKill, timeout=3)
+    for p in alive:
+        p.kill()
+    gone, alive = psutil.wait_procs(toKill, timeout=3)
+    serverprocs.invalidate()
+    if not alive:
+        return True
+    else:
+        return False
 
 
 def getProc(server):
     """Finds and returns the Process object for a given server."""
 
-    for process in psutil.process_iter(attrs=['cmdline']):
-        if f'{server}.jar' in process.info['cmdline']:
-            return process
-    return None
+    return serverprocs.get(server)
 
 
 async def sendCmd(loop, server, cmd):
-    """Passes a given command string to a server's screen."""
+    """Passes a given command string to a server's console."""
 
     log.info(f'Sending \"{cmd}\" to {server}.')
-    proc = await asyncio.create_subprocess_exec(
-        'screen', '-S', server, '-X', 'stuff', f'{cmd}\r',
-        loop=loop
-    )
-    await proc.wait()
+    return await console.send(server, cmd)
 
 
 async def sendCmds(loop, server, *cmds):
-    """Passes all given command strings to a server's screen."""
+    """Passes all given command strings to a server's console,
+    batched into as few writes as possible.
+    """
 
     for cmd in cmds:
         log.info(f'Sending \"{cmd}\" to {server}.')
-        proc = await asyncio.create_subprocess_exec(
-            'screen', '-S', server, '-X', 'stuff', f'{cmd}\r',
-            loop=loop
-        )
-        await proc.wait()
+    return await console.send_many(server, cmds)
+
+
+async def fanoutCmds(loop, servers, *cmds, limit=8, timeout=10):
+    """Passes all given command strings to each of the given servers,
+    dispatching to up to 'limit' servers concurrently.
+
+    Returns a dict mapping every server to the outcome for it,
+    which is one of 'sent', 'offline', 'timeout' or 'failed'.
+    """
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def dispatch(server):
+        if not isUp(server):
+            return 'offline'
+        async with semaphore:
+            try:
+                sent = await asyncio.wait_for(sendCmds(loop, server, *cmds), timeout)
+            except asyncio.TimeoutError:
+                log.warning(f'Sending to {server} timed out!')
+                return 'timeout'
+            except Exception as e:
+                log.error(f'Sending to {server} failed: {e}')
+                return 'failed'
+        return 'sent' if sent else 'failed'
+
+    servers = list(servers)
+    outcomes = await asyncio.gather(*[dispatch(s) for s in servers])
+    return dict(zip(servers, outcomes))
 
 
 async def exec_cmd(loop, ctx, *args):
@@ -103,6 +123,7 @@ async def serverStart(server, servercfg, loop):
     )
     await proc.wait()
     os.chdir(cwd)
+    serverprocs.invalidate()
 
 
 async def serverStop(server, loop):
@@ -141,6 +162,7 @@ async def serverStatus(servers, loop):
     Returns a list of status messages for all queried servers.
     """
     def getStatus():
+        serverprocs.refresh(force=True)
         statuses = []
         for s in servers:
             if isUp(s):
@@ -193,112 +215,4 @@ def getcrashreport(server, serverspath, nthlast: int=0):
     for a given server, in addition to the date of last modification.
     """
 
-    rpath = sorted(
-        glob.iglob(serverspath + f'/{server}/crash-reports/*'),
-        key=os.path.getmtime,
-        reverse=True
-    )[nthlast]
-    return rpath, os.path.getmtime(rpath)
-
-
-def parsereport(rpath):
-    """Retrieves and parses a crashreport given its path.
-    Returns a list containing crashreport flavor text,
-    time, description, short stacktrace and affected level
-    section, if available, in a ready to print format.
-    """
-
-    with open(rpath, 'r') as r:
-        # Discard until flavortext is found.
-        while True:
-            l = r.readline()
-            if not l:
-                break
-            if l.startswith('// '):
-                flavor = l
-                break
-        # Read in Time and Description lines.
-        r.readline()
-        crashtime = r.readline()
-        desc = r.readline()
-        r.readline()
-        # Read in short stacktrace.
-        strace = []
-        while True:
-            l = r.readline()
-            if not l or l == '\n':
-                break
-            strace.append(l)
-        # Look for relevant sections in remaining report.
-        block = []
-        level = []
-        phase = []
-        while True:
-            l = r.readline()
-            if not l:
-                break
-            if l.startswith('-- Block'):
-                block.append('# Block entity being ticked:\n')
-                while True:
-                    l = r.readline()
-                    if not l or l == '\n' or l == 'Stacktrace:\n':
-                        break
-                    block.append(l)
-            if l.startswith('-- Affected'):
-                level.append('# Affected level:\n')
-                while True:
-                    l = r.readline()
-                    if not l or l == '\n':
-                        break
-                    level.append(l)
-            if l.startswith('-- Sponge'):
-                r.readline()
-                l = r.readline()
-                if l == '\n':
-                    break
-                phase.append('# Sponge PhaseTracker:\n')
-                spongecounter = 20  # Workaround for when the PhaseTracker flips out.
-                while spongecounter > 0:
-                    spongecounter -= 1
-                    l = r.readline()
-                    if not l or l == '\n' or l.startswith('/***') or l.startswith('Stacktrace:'):
-                        break
-                    phase.append(l)
-                if len(phase) <= 1:
-                    phase = []
-
-    return crashtime, desc, strace, flavor, level, block, phase
-
-
-def formatreport(rpath, crashtime, desc, flavor, strace, *sections):
-    """Format given report sections into discord messegable chunks."""
-
-    report = []
-    report.append('> ' + os.path.basename(rpath) + '\n')
-    report.append('# ' + flavor + '\n')
-    report.append('# ' + crashtime)
-    report.append('# ' + desc + '\n')
-    report.append('# Shortened Stacktrace:\n')
-    report.extend(strace[:4])
-    report = ''.join(report)
-
-    chunks = [report]
-
-    chunk = ''
-    for s in sections:
-        siter = iter(s)
-        while len(chunk) < 2000:
-            try:
-                l = next(siter)
-            except StopIteration:
-                break
-            if (len(l) + len(chunk)) < 2000:
-                chunk += l
-            else:
-                chunks.append(chunk)
-                chunk = l
-    else:
-        if chunk:
-            chunks.append(chunk)
-
-    return chunks
+    return getcrashindex(server, serverspath).nthlast(nthlast)
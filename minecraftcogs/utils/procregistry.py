@@ -0,0 +1,107 @@
+import psutil
+import logging
+import threading
+from time import monotonic
+
+log = logging.getLogger('charfred')
+
+
+class ProcRegistry:
+    """Index of running Minecraft server processes, keyed by server name.
+
+    A full scan over all processes on the host is only done once the
+    index is older than the configured ttl, or after it was explicitly
+    invalidated; in between, lookups only check whether the indexed
+    process is still alive.
+    """
+
+    def __init__(self, ttl=10):
+        self.ttl = ttl
+        self.procs = {}
+        self.seen = set()
+        self.lastscan = None
+        self.lock = threading.Lock()
+
+    @property
+    def pids(self):
+        return {server: proc.pid for server, proc in self.procs.items()}
+
+    def scan(self):
+        """Rebuilds the index with a single pass over all processes."""
+
+        procs = {}
+        seen = set()
+        for process in psutil.process_iter(attrs=['cmdline']):
+            seen.add(process.pid)
+            _index(procs, process, process.info['cmdline'])
+        with self.lock:
+            self.procs = procs
+            self.seen = seen
+            self.lastscan = monotonic()
+        log.debug(f'PR: Indexed {len(procs)} server processes.')
+
+    def update(self):
+        """Rescans if the index is stale, otherwise only indexes processes
+        started since the last scan or update, which is cheap enough to be
+        done every second; Either way this blocks, so run it in an executor.
+        """
+
+        if self.lastscan is None or (monotonic() - self.lastscan) > self.ttl:
+            self.scan()
+            return
+        pids = set(psutil.pids())
+        procs = {}
+        for pid in pids - self.seen:
+            try:
+                process = psutil.Process(pid)
+                _index(procs, process, process.cmdline())
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        with self.lock:
+            for server, process in procs.items():
+                self.procs.setdefault(server, process)
+            self.seen = pids
+
+    def refresh(self, force=False):
+        """Rescans, if the index is stale or a rescan is forced."""
+
+        if force or self.lastscan is None or (monotonic() - self.lastscan) > self.ttl:
+            self.scan()
+
+    def invalidate(self):
+        """Marks the index as stale, so the next lookup rescans."""
+
+        with self.lock:
+            self.lastscan = None
+
+    def forget(self, server):
+        with self.lock:
+            self.procs.pop(server, None)
+
+    def get(self, server, refresh=True):
+        """Returns the Process object for a given server, or None.
+
+        With 'refresh' False, only the index as it is gets looked at.
+        """
+
+        if refresh:
+            self.refresh()
+        process = self.procs.get(server)
+        if process is None:
+            return None
+        if process.is_running():
+            return process
+        log.debug(f'PR: {server} process {process.pid} is gone.')
+        self.forget(server)
+        return None
+
+
+def _index(procs, process, cmdline):
+    if not cmdline:
+        return
+    for arg in cmdline:
+        if arg.endswith('.jar'):
+            procs.setdefault(arg[:-4], process)
+
+
+serverprocs = ProcRegistry()
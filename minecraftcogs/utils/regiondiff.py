@@ -0,0 +1,63 @@
+import os
+import tarfile
+import logging
+from .anvil import HEADER, regionpat, readheader, diffheaders
+from .restore import opendecoder
+from .archiveindex import membername
+
+log = logging.getLogger('charfred')
+
+
+def livehead(path):
+    try:
+        with open(path, 'rb') as f:
+            return readheader(f.read(HEADER))
+    except FileNotFoundError:
+        return None
+
+
+def diffregions(archive, serverdir, world):
+    """Compares the region files of a world within a backup archive
+    to the live ones, in a single streaming pass over the archive,
+    reading only the header of each region file.
+
+    Returns a dict of all regions that differ, mapping each region's
+    filename to the list of chunks that differ, or None if the region
+    is missing from the live world. Also returns the names of regions
+    that only exist in the live world.
+    """
+
+    prefix = f'{world}/region/'
+    regiondir = os.path.join(serverdir, world, 'region')
+    changed = {}
+    seen = set()
+    stream, proc = opendecoder(archive)
+    try:
+        with tarfile.open(fileobj=stream, mode='r|') as tf:
+            for info in tf:
+                name = membername(info.name)
+                if not info.isfile() or not name.startswith(prefix):
+                    continue
+                region = name[len(prefix):]
+                if not regionpat.match(region):
+                    continue
+                seen.add(region)
+                backuphead = readheader(tf.extractfile(info).read(HEADER))
+                live = livehead(os.path.join(regiondir, region))
+                if live is None:
+                    changed[region] = None
+                    continue
+                chunks = diffheaders(live, backuphead)
+                if chunks:
+                    changed[region] = chunks
+    finally:
+        stream.close()
+        if proc:
+            proc.wait()
+    try:
+        liveonly = sorted(r for r in os.listdir(regiondir)
+                          if regionpat.match(r) and r not in seen)
+    except FileNotFoundError:
+        liveonly = []
+    log.info(f'RD: {len(changed)} regions of {world} differ from {archive}.')
+    return changed, liveonly
@@ -0,0 +1,160 @@
+import re
+import functools
+
+unconvertablepat = re.compile('(&[0-9a-fr])')
+
+emojipat = re.compile('(<.?:)(.*?)(:\\d*?>)')
+
+minecraftreplacements = {
+    'l': '**',
+    'm': '~~',
+    'n': '__',
+    'o': '*'
+}
+
+discordreplacements = {
+    '**': '&l',
+    '*': '&o',
+    '_': '&o',
+    '__': '&n',
+    '~~': '&m'
+}
+
+# Tried in this order, longer delimiters first.
+discorddelimiters = ('**', '*', '~~', '__', '_')
+
+
+def _scramble(scramblee):
+    return u'█' * len(scramblee)
+
+
+def _mine(s):
+    """Translates Minecraft formatting codes into Discord markdown,
+    in a single pass, recursing only into formatted spans.
+
+    A span runs from its code to the next '&r' or the end of the line,
+    but only the last line of the text may be ended by its end.
+    """
+
+    out = []
+    pos = 0
+    end = len(s)
+    i = s.find('&')
+    while i != -1 and i < end - 1:
+        code = s[i + 1]
+        if code not in 'lmnok':
+            i = s.find('&', i + 1)
+            continue
+        start = i + 2
+        nl = s.find('\n', start)
+        limit = end if nl == -1 else nl
+        close = s.find('&r', start, limit)
+        if close != -1:
+            inner, resume = s[start:close], close + 2
+        elif nl == -1 or nl == end - 1:
+            inner, resume = s[start:limit], limit
+        else:
+            i = s.find('&', i + 1)
+            continue
+        out.append(s[pos:i])
+        if code == 'k':
+            out.append(_scramble(inner) + ' ')
+        else:
+            r = minecraftreplacements[code]
+            if '&' in inner:
+                inner = _mine(inner)
+            out.append(f'{r}{inner.strip()}{r} ')
+        pos = resume
+        i = s.find('&', pos)
+    out.append(s[pos:])
+    return ''.join(out)
+
+
+def _disco(s):
+    """Translates Discord markdown into Minecraft formatting codes,
+    in a single pass, recursing only into formatted spans.
+
+    Spans do not cross line breaks; Where a double delimiter is not
+    closed, its single counterpart is tried instead.
+    """
+
+    out = []
+    pos = 0
+    i = pos
+    end = len(s)
+    while i < end:
+        c = s[i]
+        if c not in '*~_':
+            i += 1
+            continue
+        for delim in discorddelimiters:
+            if not s.startswith(delim, i):
+                continue
+            start = i + len(delim)
+            close = s.find(delim, start)
+            if close == -1:
+                continue
+            nl = s.find('\n', start, close)
+            if nl != -1:
+                continue
+            inner = s[start:close]
+            if '*' in inner or '_' in inner or '~' in inner:
+                inner = _disco(inner)
+            out.append(s[pos:i])
+            out.append(f'{discordreplacements[delim]}{inner.strip()}&r')
+            pos = i = close + len(delim)
+            break
+        else:
+            i += 1
+    out.append(s[pos:])
+    return ''.join(out)
+
+
+@functools.lru_cache(maxsize=1024)
+def convert_to(content, to_discord=True):
+    """Translates between Minecraft formatting codes and Discord markdown.
+
+    Translations are cached, as the same lines tend to come up repeatedly.
+    """
+
+    if to_discord:
+        if '&' not in content:
+            return content
+        out = _mine(content)
+        return unconvertablepat.sub('', out) if '&' in out else out
+    else:
+        if '*' not in content and '_' not in content and '~' not in content:
+            return content
+        return _disco(content)
+
+
+def escape(string):
+    string = string.strip()
+    if '\n' in string:
+        string = string.replace('\n', '\\n')
+    if '::' in string:
+        string = string.replace('::', ':\\:').replace('::', ':\\:')
+    return string
+
+
+def unescape(string):
+    """Reverses 'escape', for fields read from the text protocol."""
+
+    if ':\\:' in string:
+        string = string.replace(':\\:', '::').replace(':\\:', '::')
+    if '\\n' in string:
+        string = string.replace('\\n', '\n')
+    return string
+
+
+def clean_emoji(string):
+    if '<' not in string:
+        return string
+    return emojipat.sub(':\\g<2>:', string)
+
+
+@functools.lru_cache(maxsize=1024)
+def clean(string):
+    """Prepares a message from Discord to be relayed to Minecraft."""
+
+    return convert_to(escape(clean_emoji(string)), to_discord=False)
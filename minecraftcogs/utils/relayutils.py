@@ -1,7 +1,14 @@
+import os
 import logging
+import functools
+import asyncio
+import json
 import re
-from collections import namedtuple, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple, deque, Counter, MutableMapping
+from discord import HTTPException
 from utils import Config, InvertableMapping
+from .relayformat import escape, unescape
 
 log = logging.getLogger('charfred')
 
@@ -12,6 +19,19 @@ MessageType = namedtuple('MessageType', [
 
 fieldspat = re.compile('(?<={)\w*(?=})')
 
+# Framed protocol version, as negotiated in the handshake.
+FRAMED = 'FRAME1'
+maxframe = 1 << 20
+
+# What to do with packets that do not fit into a full queue.
+policies = ('drop-newest', 'drop-oldest', 'coalesce', 'spill')
+
+defaultoverflow = {
+    'default': 'drop-newest',
+    'queuesize': 24,
+    'inqueuesize': 64
+}
+
 
 class TypeMapping(MutableMapping):
     """MutableMapping that handles the conversion from
@@ -58,6 +78,274 @@ class TypeMapping(MutableMapping):
                                          formatfields, encoding)
 
 
+class Packet:
+    """A relay message, as its type prefix and a list of fields.
+
+    Packets are encoded for the text protocol as '::' separated lines,
+    and for the framed protocol as a 4 byte big-endian length, followed
+    by the prefix and fields as a json array; Each encoding is done once,
+    on first use. Packets read from, or built for, the text protocol may
+    be given their text upfront, which is then relayed as is.
+    """
+
+    __slots__ = ('prefix', 'fields', 'text', '_textbytes', '_frame')
+
+    def __init__(self, prefix, fields, text=None):
+        self.prefix = prefix
+        self.fields = fields
+        self.text = text
+        self._textbytes = None
+        self._frame = None
+
+    @classmethod
+    def fromtext(cls, line):
+        """Parses a text protocol line, unescaping its fields;
+        The line itself is kept, to be relayed to text clients as is.
+        """
+
+        parts = line.split('::')
+        if len(parts) > 1 and parts[-1].strip() == '':
+            fields = parts[1:-1]
+        else:
+            fields = parts[1:]
+        return cls(parts[0], [unescape(f) for f in fields], text=line)
+
+    @classmethod
+    def fromframe(cls, payload):
+        """Decodes a frame's payload, raising ValueError if it is not
+        a json array of strings.
+        """
+
+        data = json.loads(payload.decode())
+        if not isinstance(data, list) or not data or not all(isinstance(f, str) for f in data):
+            raise ValueError('Frame is not a list of strings!')
+        return cls(data[0], data[1:])
+
+    def encode(self, framed=False):
+        if framed:
+            if self._frame is None:
+                payload = json.dumps([self.prefix] + self.fields, ensure_ascii=False).encode()
+                self._frame = len(payload).to_bytes(4, 'big') + payload
+            return self._frame
+        if self._textbytes is None:
+            if self.text is None:
+                self.text = f'{self.prefix}::' + ''.join(f'{escape(f)}::' for f in self.fields) + '\n'
+            self._textbytes = self.text.encode()
+        return self._textbytes
+
+    def merge(self, other, limit=1000):
+        """Returns a new packet with the last field of another packet
+        appended on a new line, if both are of the same type and their
+        other fields match; Otherwise, or if the merged field would be
+        longer than 'limit', returns None.
+        """
+
+        if (other.prefix != self.prefix or not self.fields or
+                other.fields[:-1] != self.fields[:-1] or len(other.fields) != len(self.fields)):
+            return None
+        last = f'{self.fields[-1]}\n{other.fields[-1]}'
+        if len(last) > limit:
+            return None
+        return Packet(self.prefix, self.fields[:-1] + [last])
+
+
+class Spill:
+    """Packets spilled to disk as json lines, to be fed back in order
+    once there is room for them again. Each packet is spilled along with
+    a head, identifying its priority or sender.
+
+    Packets are held in memory until 'batch' of them can be written out
+    together; All file access is done off the event loop, by a single
+    thread shared by all spills, which keeps it in order.
+
+    Packets lost to failed writes or reads, such as on a full disk, are
+    counted as dropped in 'stats', and no longer counted as spilled.
+
+    Spilled packets do not survive a restart, as they would be stale.
+    """
+
+    _io = ThreadPoolExecutor(max_workers=1)
+
+    def __init__(self, loop, path, batch=64, stats=None):
+        self.loop = loop
+        self.path = path
+        self.batch = batch
+        self.stats = stats if stats is not None else Counter()
+        self.generation = 0
+        # Only touched by the io thread.
+        self.offset = 0
+        self.ondisk = 0
+        self.clear()
+
+    def clear(self):
+        self.buffer = []
+        self.count = 0
+        self.written = 0
+        self.generation += 1
+        self.loop.run_in_executor(self._io, self._remove)
+
+    def _remove(self):
+        self.offset = 0
+        self.ondisk = 0
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.error(f'CR-Spill: Could not remove {self.path}: {e}')
+
+    def _append(self, lines):
+        """Appends lines to the spill file, returns the number of lines lost."""
+
+        try:
+            data = ''.join(lines).encode()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'ab', buffering=0) as f:
+                start = f.seek(0, os.SEEK_END)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[f.write(view):]
+                except OSError:
+                    # Don't leave half a line behind.
+                    f.truncate(start)
+                    raise
+        except (OSError, ValueError) as e:
+            log.error(f'CR-Spill: Writing to {self.path} failed, {len(lines)} packets lost: {e}')
+            return len(lines)
+        self.ondisk += len(lines)
+        return 0
+
+    def _read(self, n):
+        """Reads up to n lines from the spill file, returns them along
+        with the number of lines lost, should the file be unreadable.
+        """
+
+        lines = []
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                while len(lines) < n:
+                    line = f.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+                self.offset = f.tell()
+                done = self.offset >= os.fstat(f.fileno()).st_size
+        except OSError as e:
+            lost = self.ondisk - len(lines)
+            log.error(f'CR-Spill: Reading {self.path} failed, {lost} packets lost: {e}')
+            self._remove()
+            return lines, lost
+        self.ondisk -= len(lines)
+        if done:
+            self._remove()
+        return lines, 0
+
+    def _lost(self, n):
+        self.written -= n
+        self.count -= n
+        self.stats['dropped'] += n
+
+    def _appended(self, generation, future):
+        if generation == self.generation and future.result():
+            self._lost(future.result())
+
+    def push(self, head, packet):
+        self.buffer.append(json.dumps([head, packet.prefix, packet.fields, packet.text],
+                                      ensure_ascii=False) + '\n')
+        self.count += 1
+        if len(self.buffer) >= self.batch:
+            lines, self.buffer = self.buffer, []
+            self.written += len(lines)
+            future = self.loop.run_in_executor(self._io, self._append, lines)
+            future.add_done_callback(functools.partial(self._appended, self.generation))
+
+    async def pop(self, n):
+        """Returns up to n of the oldest spilled (head, packet) pairs."""
+
+        lines = []
+        if self.written and n > 0:
+            generation = self.generation
+            lines, lost = await self.loop.run_in_executor(self._io, self._read, n)
+            if generation != self.generation:
+                return []
+            self.written -= len(lines)
+            self.count -= len(lines)
+            if lost:
+                self._lost(lost)
+        # Packets buffered meanwhile may have been written out after the ones
+        # just read, then the buffer only holds packets newer than those.
+        if not self.written and len(lines) < n:
+            take = n - len(lines)
+            self.count -= len(self.buffer[:take])
+            lines.extend(self.buffer[:take])
+            del self.buffer[:take]
+        items = []
+        for line in lines:
+            try:
+                head, prefix, fields, text = json.loads(line)
+            except ValueError:
+                self.stats['dropped'] += 1
+                continue
+            items.append((head, Packet(prefix, fields, text=text)))
+        return items
+
+    def __len__(self):
+        return self.count
+
+
+def _coalesce(queue, item):
+    """Merges an item's packet into the newest queued packet from the same
+    head it can be merged with. Returns False if there is none.
+
+    Items are tuples ending in their packet, with their head first;
+    The queue is drained and refilled, which keeps the order of its items.
+    """
+
+    queued = [queue.get_nowait() for _ in range(queue.qsize())]
+    merged = None
+    for i in reversed(range(len(queued))):
+        other = queued[i]
+        if other[0] == item[0]:
+            merged = other[-1].merge(item[-1])
+            if merged:
+                queued[i] = other[:-1] + (merged,)
+                break
+    for other in queued:
+        queue.put_nowait(other)
+    return merged is not None
+
+
+def overflow(queue, item, policy, stats, spill=None):
+    """Puts an item into a bounded queue according to an overflow policy,
+    counting what happens to it in 'stats'.
+
+    'drop-newest' drops the item, 'drop-oldest' drops the next item due
+    to make room for it, 'coalesce' merges its packet into a queued one,
+    see 'Packet.merge', or else drops the oldest, and 'spill' spills it to
+    disk, see 'Spill'; Once anything was spilled, further spilling items
+    are spilled as well, so they keep their order.
+    """
+
+    if policy == 'spill' and spill is not None and (spill or queue.full()):
+        spill.push(item[0], item[-1])
+        stats['spilled'] += 1
+        return
+    if not queue.full():
+        queue.put_nowait(item)
+        return
+    if policy == 'coalesce':
+        if _coalesce(queue, item):
+            stats['coalesced'] += 1
+            return
+        policy = 'drop-oldest'
+    if policy == 'drop-oldest':
+        queue.get_nowait()
+        queue.put_nowait(item)
+    stats['dropped'] += 1
+
+
 class RelayConfig(Config):
     """Config subclass holding exposing multiple internal dictionaries,
     saved to a single config file.
@@ -67,7 +355,8 @@ class RelayConfig(Config):
         default = {
             'types': initial,
             'routing': {},
-            'typerouting': {}
+            'typerouting': {},
+            'overflow': dict(defaultoverflow, clients={}, types={})
         }
         super().__init__(cfgfile, default=default, **opts)
 
@@ -99,6 +388,21 @@ class RelayConfig(Config):
     def ch_type(self):
         return self.store['typerouting'].inverted
 
+    @property
+    def overflow(self):
+        return self.store['overflow']
+
+    def policy(self, client, prefix):
+        """Returns the overflow policy for a client and message type;
+        A policy set for the type wins over one set for the client.
+        """
+
+        overflow = self.store['overflow']
+        try:
+            return overflow['types'][prefix]
+        except KeyError:
+            return overflow['clients'].get(client, overflow['default'])
+
     def as_dict(self):
         _store = {}
         for k, v in self.store.items():
@@ -116,6 +420,11 @@ class RelayConfig(Config):
         self.store['types'] = TypeMapping(self.store['types'])
         self.store['routing'] = InvertableMapping(self.store['routing'])
         self.store['typerouting'] = InvertableMapping(self.store['typerouting'])
+        overflow = self.store.setdefault('overflow', {})
+        for k, v in defaultoverflow.items():
+            overflow.setdefault(k, v)
+        overflow.setdefault('clients', {})
+        overflow.setdefault('types', {})
 
     def _load(self):
         super()._load()
@@ -123,3 +432,98 @@ class RelayConfig(Config):
 
     def _save(self):
         super()._save(savee=self.as_dict())
+
+
+class Dispatcher:
+    """Dispatches lines to discord channels, each channel being served by
+    its own worker with its own bounded queue, so a slow or rate-limited
+    channel never holds up any other.
+
+    Workers merge lines arriving within 'window' seconds into as few
+    messages as possible, each at most 'limit' characters. At most
+    'maxpending' lines are queued per channel, beyond which the oldest
+    lines are dropped. Workers exit after 'idle' seconds without lines.
+
+    Counts lines, messages sent, lines merged into another message,
+    and lines dropped or failed to send in 'stats'.
+    """
+
+    def __init__(self, loop, window=0.5, limit=2000, maxpending=100, idle=300, stats=None):
+        self.loop = loop
+        self.window = window
+        self.limit = limit
+        self.maxpending = maxpending
+        self.idle = idle
+        self.stats = stats if stats is not None else Counter()
+        self.queues = {}
+        self.workers = {}
+
+    def push(self, channel, line):
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = asyncio.Queue(maxsize=self.maxpending)
+        if queue.full():
+            queue.get_nowait()
+            self.stats['dropped'] += 1
+        queue.put_nowait(line)
+        self.stats['lines'] += 1
+        if channel.id not in self.workers:
+            self.workers[channel.id] = self.loop.create_task(self._work(channel, queue))
+
+    def pending(self):
+        """Returns the number of lines queued per channel id."""
+
+        return {ch_id: queue.qsize() for ch_id, queue in self.queues.items()}
+
+    def _take(self, buf):
+        """Takes as many lines as fit into one message from a buffer."""
+
+        lines = []
+        size = 0
+        while buf:
+            line = buf[0]
+            if len(line) > self.limit:
+                if lines:
+                    break
+                buf[0] = line[self.limit:]
+                lines.append(line[:self.limit])
+                break
+            if size + len(line) + len(lines) > self.limit:
+                break
+            lines.append(buf.popleft())
+            size += len(line)
+        self.stats['merged'] += len(lines) - 1
+        return '\n'.join(lines)
+
+    async def _work(self, channel, queue):
+        log.debug(f'CR-Dispatcher: Worker for {channel} started.')
+        buf = deque()
+        try:
+            while True:
+                if not buf:
+                    try:
+                        buf.append(await asyncio.wait_for(queue.get(), self.idle))
+                    except asyncio.TimeoutError:
+                        break
+                    await asyncio.sleep(self.window)
+                while not queue.empty():
+                    buf.append(queue.get_nowait())
+                while len(buf) > self.maxpending:
+                    buf.popleft()
+                    self.stats['dropped'] += 1
+                message = self._take(buf)
+                try:
+                    await channel.send(message)
+                except HTTPException as e:
+                    log.warning(f'CR-Dispatcher: Sending to {channel} failed: {e}')
+                    self.stats['failed'] += 1
+                else:
+                    self.stats['messages'] += 1
+        finally:
+            del self.workers[channel.id]
+            del self.queues[channel.id]
+            log.debug(f'CR-Dispatcher: Worker for {channel} exited.')
+
+    def cancel(self):
+        for task in self.workers.values():
+            task.cancel()
@@ -0,0 +1,181 @@
+import os
+import gzip
+import shutil
+import tarfile
+import tempfile
+import logging
+import threading
+import subprocess
+from time import strftime
+from concurrent.futures import ThreadPoolExecutor
+from .archiveindex import loadindex
+
+log = logging.getLogger('charfred')
+
+
+def opendecoder(archive):
+    """Opens a decompressed stream of a given archive.
+
+    Uses pigz for .tar.gz and zstd for .tar.zst archives if available,
+    both of which decompress in a separate process, in parallel with
+    unpacking, falling back to in-process gzip decompression.
+
+    Returns the stream and the decoder process, if any.
+    """
+
+    if archive.endswith('.tar.zst'):
+        cmd = ['zstd', '-dcq', '-T0', archive]
+    elif shutil.which('pigz'):
+        cmd = ['pigz', '-dc', archive]
+    else:
+        return gzip.open(archive, 'rb'), None
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=1 << 20)
+    return proc.stdout, proc
+
+
+def swapin(staging, serverdir):
+    """Swaps every top-level entry of a staging directory into serverdir,
+    renaming the live entries aside, rolling back if anything fails.
+
+    Returns the entries swapped in and the paths of the entries set aside.
+    """
+
+    stamp = strftime('%Y%m%d-%H%M%S')
+    entries = os.listdir(staging)
+    swapped = []
+    try:
+        for name in entries:
+            live = os.path.join(serverdir, name)
+            aside = None
+            if os.path.lexists(live):
+                aside = f'{live}.old-{stamp}'
+                os.rename(live, aside)
+            swapped.append((live, aside))
+            os.rename(os.path.join(staging, name), live)
+    except OSError:
+        log.error('RS: Swapping in restored files failed, rolling back!')
+        for live, aside in reversed(swapped):
+            # Entries without a live counterpart go back too, to be removed with the staging.
+            if os.path.lexists(live):
+                os.rename(live, os.path.join(staging, os.path.basename(live)))
+            if aside:
+                os.rename(aside, live)
+        raise
+    return entries, [aside for _, aside in swapped if aside]
+
+
+def removeaside(paths):
+    """Deletes live entries that were set aside by 'swapin'."""
+
+    for aside in paths:
+        log.info(f'RS: Deleting {aside}.')
+        if os.path.isdir(aside) and not os.path.islink(aside):
+            shutil.rmtree(aside)
+        else:
+            os.remove(aside)
+
+
+class RestoreJob:
+    """Full restore of a backup archive into a server directory.
+
+    The archive is unpacked into a staging directory next to the live files,
+    with the contents of small files written out by a pool of writer threads,
+    while files larger than 'chunk' bytes are streamed to disk as they are
+    read, so at most 'maxpending' chunks are ever held in memory.
+    Only once everything is unpacked, each top-level entry of the archive is
+    swapped in, by renaming the live entry aside and the staged one in place.
+    The live world is never touched if unpacking fails.
+    """
+
+    def __init__(self, archive, serverdir, writers=None, maxpending=64, chunk=1 << 20):
+        self.archive = archive
+        self.serverdir = serverdir
+        self.chunk = chunk
+        self.writers = writers or min(8, (os.cpu_count() or 1) + 2)
+        self.pending = threading.BoundedSemaphore(maxpending)
+        self.total = None
+        self.done = 0
+        self.files = 0
+        self.aside = []
+
+    def progress(self):
+        done = self.done / 1048576
+        if self.total:
+            return (f'> Restored {self.files} files, {done:.0f} of '
+                    f'{self.total / 1048576:.0f} MiB ({self.done / self.total:.0%})')
+        return f'> Restored {self.files} files, {done:.0f} MiB'
+
+    def _write(self, target, data, mode, mtime):
+        try:
+            with open(target, 'wb') as f:
+                f.write(data)
+            os.chmod(target, mode)
+            os.utime(target, (mtime, mtime))
+        finally:
+            self.pending.release()
+
+    def _stream(self, target, member, info):
+        with open(target, 'wb') as f:
+            shutil.copyfileobj(member, f, self.chunk)
+        os.chmod(target, info.mode)
+        os.utime(target, (info.mtime, info.mtime))
+
+    def _unpack(self, staging):
+        stream, proc = opendecoder(self.archive)
+        futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.writers) as pool:
+                with tarfile.open(fileobj=stream, mode='r|') as tf:
+                    for info in tf:
+                        target = os.path.abspath(os.path.join(staging, info.name))
+                        if not target.startswith(staging + os.sep):
+                            log.warning(f'RS: Skipping {info.name}, outside of target!')
+                            continue
+                        if info.isdir():
+                            os.makedirs(target, exist_ok=True)
+                        elif info.isfile():
+                            os.makedirs(os.path.dirname(target), exist_ok=True)
+                            member = tf.extractfile(info)
+                            if info.size > self.chunk:
+                                self._stream(target, member, info)
+                            else:
+                                data = member.read()
+                                self.pending.acquire()
+                                futures.append(pool.submit(self._write, target, data,
+                                                           info.mode, info.mtime))
+                            self.files += 1
+                        else:
+                            tf.extract(info, staging)
+                        self.done += info.size
+            for future in futures:
+                future.result()
+        finally:
+            stream.close()
+            failed = proc is not None and proc.wait() != 0
+        # Only reached without an exception in flight, which would say more.
+        if failed:
+            raise OSError(f'Decoder for {self.archive} failed!')
+
+    def run(self):
+        """Unpacks and swaps in the backup, returns the top-level entries replaced.
+
+        The replaced live entries are left aside, see 'cleanup'.
+        """
+
+        index = loadindex(self.archive, build=False)
+        if index:
+            self.total = sum(m[1] for m in index['members'].values())
+        staging = os.path.abspath(tempfile.mkdtemp(prefix='.restore-', dir=self.serverdir))
+        try:
+            self._unpack(staging)
+            entries, self.aside = swapin(staging, self.serverdir)
+            log.info(f'RS: Restored {entries} from {self.archive}.')
+            return entries
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def cleanup(self):
+        """Deletes the live entries that were moved aside."""
+
+        removeaside(self.aside)
+        self.aside = []
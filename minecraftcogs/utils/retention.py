@@ -0,0 +1,134 @@
+import os
+import json
+import logging
+from time import time, localtime, strftime
+from .archiveindex import indexpath
+
+log = logging.getLogger('charfred')
+
+buckets = {
+    'hourly': '%Y-%m-%d %H',
+    'daily': '%Y-%m-%d',
+    'weekly': '%G-%V',
+    'monthly': '%Y-%m'
+}
+
+
+def gfsplan(backups, policy, now=None):
+    """Decides which backups to keep, grandfather-father-son style.
+
+    'backups' is a list of (name, timestamp, size) tuples; The policy
+    may hold the number of hourly, daily, weekly and monthly backups to
+    keep, of which the newest backup in each period is kept.
+    Additionally the newest 'keep' backups, and all backups younger than
+    'within' seconds, are always kept.
+
+    Returns lists of the backups to keep and to prune, newest first.
+    """
+
+    now = now or time()
+    backups = sorted(backups, key=lambda b: b[1], reverse=True)
+    keep = set(b[0] for b in backups[:policy.get('keep', 1)])
+    within = policy.get('within')
+    if within:
+        keep.update(b[0] for b in backups if now - b[1] < within)
+    for bucket, fmt in buckets.items():
+        count = policy.get(bucket, 0)
+        if not count:
+            continue
+        periods = set()
+        for name, timestamp, _ in backups:
+            period = strftime(fmt, localtime(timestamp))
+            if period in periods:
+                continue
+            if len(periods) == count:
+                break
+            periods.add(period)
+            keep.add(name)
+    return ([b for b in backups if b[0] in keep],
+            [b for b in backups if b[0] not in keep])
+
+
+def prunefiles(paths):
+    """Deletes the given files along with their sidecars.
+
+    Returns the number of bytes freed.
+    """
+
+    freed = 0
+    for path in paths:
+        for p in (path, indexpath(path)):
+            try:
+                size = os.stat(p).st_size
+                os.remove(p)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                log.error(f'RT: Could not delete {p}: {e}')
+                continue
+            freed += size
+    log.info(f'RT: Pruned {len(paths)} files, {freed} bytes freed.')
+    return freed
+
+
+def collectgarbage(backupspath, grace=3600):
+    """Deletes all blocks from the snapshot chunk store that are not
+    referenced by any snapshot of any server.
+
+    Blocks written or reused within the last 'grace' seconds are left
+    alone, as they might belong to a snapshot that is still being taken.
+
+    Returns the number of bytes freed.
+    """
+
+    storepath = os.path.join(backupspath, '.chunkstore')
+    if not os.path.isdir(storepath):
+        return 0
+    referenced = set()
+    with os.scandir(backupspath) as servers:
+        for server in servers:
+            snapdir = os.path.join(server.path, 'snapshots')
+            if server.name.startswith('.') or not os.path.isdir(snapdir):
+                continue
+            for name in os.listdir(snapdir):
+                if not name.endswith('.json'):
+                    continue
+                with open(os.path.join(snapdir, name), 'r') as f:
+                    manifest = json.load(f)
+                for entry in manifest['files'].values():
+                    referenced.update(block[2] for block in entry['blocks'])
+    freed = 0
+    cutoff = time() - grace
+    for root, _, names in os.walk(storepath):
+        for name in names:
+            if name in referenced:
+                continue
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            if st.st_mtime > cutoff:
+                continue
+            os.remove(path)
+            freed += st.st_size
+    log.info(f'RT: Collected {freed} bytes of unreferenced snapshot blocks.')
+    return freed
+
+
+def usagetrend(samples, span=7 * 86400):
+    """Returns the growth in bytes per day over the given span of
+    usage samples, as (time, bytes) pairs, by least squares; Or None
+    if there are too few samples.
+    """
+
+    if not samples:
+        return None
+    recent = [s for s in samples if s[0] >= samples[-1][0] - span]
+    if len(recent) < 2:
+        return None
+    n = len(recent)
+    mt = sum(s[0] for s in recent) / n
+    mb = sum(s[1] for s in recent) / n
+    var = sum((s[0] - mt) ** 2 for s in recent)
+    if not var:
+        return None
+    slope = sum((s[0] - mt) * (s[1] - mb) for s in recent) / var
+    return slope * 86400
@@ -0,0 +1,185 @@
+import os
+import json
+import hashlib
+import logging
+from time import time, strftime
+from .anvil import regionpat, regionspans
+
+log = logging.getLogger('charfred')
+
+blocksize = 1 << 20
+
+
+class ChunkStore:
+    """Content-addressed store of data blocks, kept as files named
+    after the sha256 of their contents, below a given directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def blockpath(self, h):
+        return os.path.join(self.path, h[:2], h)
+
+    def has(self, h):
+        return os.path.exists(self.blockpath(h))
+
+    def put(self, data):
+        """Stores a block, unless already present.
+
+        A block already present has its mtime refreshed instead, so
+        garbage collection leaves it to the snapshot reusing it, see
+        'collectgarbage'.
+
+        Returns its hash and whether it had to be written.
+        """
+
+        h = hashlib.sha256(data).hexdigest()
+        path = self.blockpath(h)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        else:
+            return h, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return h, True
+
+    def get(self, h):
+        with open(self.blockpath(h), 'rb') as f:
+            return f.read()
+
+
+def _fileblocks(path, size):
+    """Yields (offset, data) for all blocks of a file.
+
+    Region files are split along their chunks, so a chunk that did not
+    change is stored only once, no matter where in the file it sits;
+    all other files are split into fixed size blocks.
+    """
+
+    with open(path, 'rb') as f:
+        if regionpat.match(os.path.basename(path)):
+            data = f.read()
+            for offset, length in regionspans(data):
+                yield offset, data[offset:offset + length]
+        else:
+            offset = 0
+            while offset < size:
+                data = f.read(blocksize)
+                if not data:
+                    break
+                yield offset, data
+                offset += len(data)
+
+
+def snapshot(serverdir, worlds, store, previous=None):
+    """Takes a snapshot of the given world directories within serverdir.
+
+    Files that have the same size and mtime as in the previous snapshot
+    are not read again, of all other files only blocks not yet in the
+    store get written.
+
+    Returns the manifest of the new snapshot.
+    """
+
+    prevfiles = previous['files'] if previous else {}
+    files = {}
+    stats = {'files': 0, 'read': 0, 'written': 0, 'reused': 0}
+    for world in worlds:
+        for root, _, names in os.walk(os.path.join(serverdir, world)):
+            for name in names:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, serverdir)
+                st = os.stat(path)
+                stats['files'] += 1
+                prev = prevfiles.get(rel)
+                if prev and prev['size'] == st.st_size and prev['mtime'] == st.st_mtime:
+                    files[rel] = prev
+                    stats['reused'] += st.st_size
+                    continue
+                blocks = []
+                for offset, data in _fileblocks(path, st.st_size):
+                    h, written = store.put(data)
+                    blocks.append([offset, len(data), h])
+                    stats['read'] += len(data)
+                    if written:
+                        stats['written'] += len(data)
+                files[rel] = {
+                    'size': st.st_size, 'mtime': st.st_mtime,
+                    'mode': st.st_mode & 0o7777, 'blocks': blocks
+                }
+    log.info(f'SN: Snapshot of {serverdir}: {stats}')
+    return {'created': time(), 'worlds': list(worlds), 'stats': stats, 'files': files}
+
+
+def restoresnapshot(manifest, store, dest):
+    """Rebuilds all files of a snapshot below dest."""
+
+    for rel, entry in manifest['files'].items():
+        target = os.path.abspath(os.path.join(dest, rel))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.truncate(entry['size'])
+            for offset, _, h in entry['blocks']:
+                f.seek(offset)
+                f.write(store.get(h))
+        os.chmod(target, entry['mode'])
+        os.utime(target, (entry['mtime'], entry['mtime']))
+
+
+class Snapshots:
+    """Snapshot manifests of a single server, stored as json files
+    next to its regular backups, sharing one ChunkStore with all servers.
+    """
+
+    def __init__(self, backupspath, server):
+        self.path = os.path.join(backupspath, server, 'snapshots')
+        self.store = ChunkStore(os.path.join(backupspath, '.chunkstore'))
+
+    def list(self):
+        try:
+            return sorted(n[:-5] for n in os.listdir(self.path) if n.endswith('.json'))
+        except FileNotFoundError:
+            return []
+
+    def load(self, name):
+        with open(os.path.join(self.path, f'{name}.json'), 'r') as f:
+            return json.load(f)
+
+    def find(self, part):
+        """Returns the name of the one snapshot matching a given part, or None."""
+
+        matches = [n for n in self.list() if part in n]
+        if part in matches:
+            return part
+        return matches[0] if len(matches) == 1 else None
+
+    def remove(self, names):
+        """Deletes the manifests of the given snapshots; Blocks no longer
+        referenced are left for the retention's garbage collection.
+        """
+
+        for name in names:
+            try:
+                os.remove(os.path.join(self.path, f'{name}.json'))
+            except FileNotFoundError:
+                pass
+
+    def take(self, serverdir, worlds):
+        """Takes and saves a new snapshot, returns its name and manifest."""
+
+        names = self.list()
+        previous = self.load(names[-1]) if names else None
+        manifest = snapshot(serverdir, worlds, self.store, previous)
+        name = strftime('%Y-%m-%d_%H-%M-%S')
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, f'.{name}.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(self.path, f'{name}.json'))
+        return name, manifest
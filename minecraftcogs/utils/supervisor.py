@@ -0,0 +1,108 @@
+import os
+import asyncio
+import logging
+from .procregistry import serverprocs
+
+log = logging.getLogger('charfred')
+
+
+class Watched:
+    __slots__ = ('handler', 'proc', 'pidfd')
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.proc = None
+        self.pidfd = None
+
+
+class Supervisor:
+    """Watches the processes of any number of servers from one task.
+
+    Where pidfds are available, a server's exit is noticed as soon as its
+    process is gone; otherwise all watched processes are checked together
+    once every 'interval' seconds. Servers coming back up are found through
+    the shared process registry, updated in an executor on every pass while
+    any server is down, so the event loop is never held up by scanning.
+
+    Handlers are coroutine functions, called with the servername and
+    a boolean indicating whether the server came up or went down.
+    """
+
+    interval = 1
+
+    def __init__(self, loop, procs=serverprocs):
+        self.loop = loop
+        self.procs = procs
+        self.watched = {}
+        self.task = None
+
+    def watch(self, server, handler):
+        """Starts watching a given server, returns whether it is up."""
+
+        self.unwatch(server)
+        self.watched[server] = Watched(handler)
+        proc = self.procs.get(server)
+        if proc:
+            self._attach(server, self.watched[server], proc)
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self._run())
+        return proc is not None
+
+    def unwatch(self, server):
+        watched = self.watched.pop(server, None)
+        if watched:
+            self._detach(watched)
+        if not self.watched and self.task:
+            self.task.cancel()
+            self.task = None
+
+    def isWatched(self, server):
+        return server in self.watched
+
+    def _attach(self, server, watched, proc):
+        watched.proc = proc
+        if not hasattr(os, 'pidfd_open'):
+            return
+        try:
+            watched.pidfd = os.pidfd_open(proc.pid)
+        except OSError as e:
+            log.debug(f'SV: No pidfd for {server}: {e}')
+            return
+        self.loop.add_reader(watched.pidfd, self._exited, server)
+
+    def _detach(self, watched):
+        if watched.pidfd is not None:
+            self.loop.remove_reader(watched.pidfd)
+            os.close(watched.pidfd)
+            watched.pidfd = None
+        watched.proc = None
+
+    def _exited(self, server):
+        watched = self.watched.get(server)
+        if watched:
+            self._gone(server, watched)
+
+    def _gone(self, server, watched):
+        log.info(f'SV: {server} is gone!')
+        self._detach(watched)
+        self.procs.forget(server)
+        self.loop.create_task(watched.handler(server, False))
+
+    async def _run(self):
+        log.info('SV: Supervisor started.')
+        try:
+            while self.watched:
+                if any(watched.proc is None for watched in self.watched.values()):
+                    await self.loop.run_in_executor(None, self.procs.update)
+                for server, watched in list(self.watched.items()):
+                    if watched.proc is None:
+                        proc = self.procs.get(server, refresh=False)
+                        if proc:
+                            log.info(f'SV: {server} is up!')
+                            self._attach(server, watched, proc)
+                            self.loop.create_task(watched.handler(server, True))
+                    elif watched.pidfd is None and not watched.proc.is_running():
+                        self._gone(server, watched)
+                await asyncio.sleep(self.interval)
+        finally:
+            log.info('SV: Supervisor stopped.')
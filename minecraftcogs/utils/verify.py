@@ -0,0 +1,186 @@
+import os
+import gzip
+import zlib
+import asyncio
+import hashlib
+import logging
+import tarfile
+import threading
+from time import time, monotonic, sleep
+from concurrent.futures import ThreadPoolExecutor
+from .archiveindex import writeindex, membername
+
+log = logging.getLogger('charfred')
+
+
+class Throttle:
+    """Token bucket limiting the combined read rate of all threads
+    sharing it to 'rate' bytes per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = rate
+        self.last = monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n):
+        if not self.rate:
+            return
+        with self.lock:
+            now = monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= n
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            sleep(wait)
+
+
+class _Reader:
+    """File-like hashing everything read through it, throttled."""
+
+    def __init__(self, f, throttle):
+        self.f = f
+        self.throttle = throttle
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n=-1):
+        data = self.f.read(n)
+        self.sha.update(data)
+        self.size += len(data)
+        if self.throttle:
+            self.throttle.consume(len(data))
+        return data
+
+
+def verifyarchive(path, throttle=None):
+    """Checks a .tar.gz archive in a single streaming pass.
+
+    Every member is read in full, so the tar structure is walked
+    completely, and the gzip stream is read to its end, so its CRC and
+    length get checked; All while computing the archive's sha256.
+
+    Returns a dict of the results; 'error' being None if the archive is ok,
+    'index' holding the member index, as kept by 'archiveindex'.
+    """
+
+    result = {'verified': time(), 'error': None, 'checksum': None, 'index': {}}
+    with open(path, 'rb') as f:
+        reader = _Reader(f, throttle)
+        try:
+            with gzip.GzipFile(fileobj=reader, mode='rb') as gz:
+                with tarfile.open(fileobj=gz, mode='r|') as tf:
+                    for info in tf:
+                        if info.isfile():
+                            result['index'][membername(info.name)] = [info.offset_data, info.size,
+                                                          info.mode, info.mtime]
+                            member = tf.extractfile(info)
+                            while member.read(1 << 20):
+                                pass
+                while gz.read(1 << 20):
+                    pass
+        except EOFError:
+            result['error'] = 'Archive is truncated!'
+        except (OSError, zlib.error) as e:
+            result['error'] = f'Archive is corrupted: {e}'
+        except tarfile.TarError as e:
+            result['error'] = f'Archive is not a valid tar: {e}'
+        else:
+            # Anything trailing the gzip stream is hashed too.
+            while reader.read(1 << 20):
+                pass
+            result['checksum'] = reader.sha.hexdigest()
+    return result
+
+
+class Verifier:
+    """Verifies backup archives in the background.
+
+    Archives are queued with 'schedule' and verified by a bounded pool of
+    worker threads, whose combined reads are throttled to 'rate' bytes per
+    second, so verification does not compete with live servers for disk.
+    As this is the one pass over each archive, it also writes the archive's
+    member index and fills in its catalog entry. Results are passed to the
+    'onresult' coroutine function, with server, name and result.
+
+    Archives modified within the last 'settle' seconds, or changed since
+    they were cataloged, may still be written to and are left for later.
+    """
+
+    def __init__(self, loop, onresult, workers=2, rate=32 << 20, settle=300):
+        self.loop = loop
+        self.onresult = onresult
+        self.settle = settle
+        self.throttle = Throttle(rate)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.queue = asyncio.Queue()
+        self.queued = set()
+        self.tasks = [loop.create_task(self._work()) for _ in range(workers)]
+
+    def schedule(self, server, catalog, names=None):
+        """Queues all archives of a catalog that were never verified,
+        or the given ones. Returns the number of archives queued.
+        """
+
+        if names is None:
+            names = [name for name, entry in catalog.query() if not entry.get('verified')]
+        cutoff = time() - self.settle
+        count = 0
+        for name in names:
+            if (catalog.path, name) in self.queued:
+                continue
+            entry = catalog.entries.get(name)
+            if entry is None or entry['mtime'] > cutoff:
+                continue
+            self.queued.add((catalog.path, name))
+            self.queue.put_nowait((server, catalog, name))
+            count += 1
+        return count
+
+    def _settled(self, catalog, name, st):
+        entry = catalog.entries.get(name)
+        return (entry is not None and entry['size'] == st.st_size and
+                entry['mtime'] == st.st_mtime and st.st_mtime <= time() - self.settle)
+
+    def _verify(self, catalog, name):
+        """Verifies an archive and records the result, or returns None
+        if the archive is not settled, before or after verification.
+        """
+
+        path = f'{catalog.path}/{name}'
+        st = os.stat(path)
+        if not self._settled(catalog, name, st):
+            return None
+        result = verifyarchive(path, self.throttle)
+        if not self._settled(catalog, name, os.stat(path)):
+            return None
+        if not result['error']:
+            writeindex(path, result['index'], st)
+        catalog.record(name, result)
+        catalog.save()
+        return result
+
+    async def _work(self):
+        while True:
+            server, catalog, name = await self.queue.get()
+            try:
+                result = await self.loop.run_in_executor(
+                    self.pool, self._verify, catalog, name
+                )
+                if result is None:
+                    log.info(f'VF: {name} is still being written, verifying it later.')
+                else:
+                    await self.onresult(server, name, result)
+            except FileNotFoundError:
+                log.info(f'VF: {name} is gone, skipping verification.')
+            except Exception as e:
+                log.error(f'VF: Verification of {name} failed: {e}')
+            finally:
+                self.queued.discard((catalog.path, name))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.pool.shutdown(wait=False)